@@ -0,0 +1,63 @@
+import json
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+# ivasms.com accounts monitored by this process: a JSON list, or the path of a JSON file holding one.
+# Each entry has "name", "email", "password" and optionally "chat_id"; without it,
+# IVASMS_EMAIL/IVASMS_PASSWORD/CHAT_ID describe a single account.
+IVASMS_ACCOUNTS = os.getenv("IVASMS_ACCOUNTS", "")
+
+DEFAULT_ACCOUNT = "default"
+
+class Account:
+    """Credentials and Telegram routing of one ivasms.com account."""
+
+    def __init__(self, name, email, password, chat_id=None):
+        self.name = name
+        self.email = email
+        self.password = password
+        self.chat_id = chat_id
+
+    def __repr__(self):
+        return f"Account({self.name!r}, {self.email!r})"
+
+    def store_path(self, path):
+        """Per-account variant of a state file name; the default account keeps the plain name."""
+        if self.name == DEFAULT_ACCOUNT:
+            return path
+        root, ext = os.path.splitext(path)
+        return f"{root}_{self.name}{ext}"
+
+def load_accounts(spec=IVASMS_ACCOUNTS, default_chat_id=None):
+    """Return the configured accounts, falling back to the single IVASMS_EMAIL account."""
+    default_chat_id = default_chat_id or os.getenv("CHAT_ID")
+    if not spec.strip():
+        return [Account(DEFAULT_ACCOUNT, os.getenv("IVASMS_EMAIL"), os.getenv("IVASMS_PASSWORD"), default_chat_id)]
+
+    try:
+        if os.path.isfile(spec):
+            with open(spec, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        else:
+            entries = json.loads(spec)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.error(f"Reading IVASMS_ACCOUNTS failed: {str(e)}")
+        raise
+
+    if not isinstance(entries, list) or not entries:
+        raise ValueError("IVASMS_ACCOUNTS must be a non-empty JSON list")
+    accounts = []
+    for entry in entries:
+        name = str(entry.get("name") or entry.get("email", ""))
+        name = re.sub(r"[^A-Za-z0-9_.-]+", "_", name).strip("_")
+        if not name or not entry.get("email") or not entry.get("password"):
+            raise ValueError(f"Account entry needs a name or email and a password: {entry.get('name')!r}")
+        if name in (a.name for a in accounts):
+            raise ValueError(f"Duplicate account name: {name}")
+        chat_id = entry.get("chat_id") or default_chat_id
+        accounts.append(Account(name, entry["email"], entry["password"], str(chat_id) if chat_id else None))
+    logger.info(f"Monitoring {len(accounts)} accounts: {', '.join(a.name for a in accounts)}")
+    return accounts
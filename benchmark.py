@@ -0,0 +1,276 @@
+import argparse
+import asyncio
+import glob
+import json
+import logging
+import os
+import random
+import statistics
+import time
+import tracemalloc
+import urllib.parse
+from datetime import datetime
+
+import httpx
+
+import parsers
+import synthetic
+from crawler import crawl_statistics
+from portal import payload_4
+from transport import RequestLimiter
+
+logger = logging.getLogger(__name__)
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+FIXTURE_PARSERS = {
+    "statistics": parsers.parse_statistics,
+    "numbers": parsers.parse_numbers,
+    "messages": parsers.parse_message,
+    "active": parsers.parse_active_data
+}
+STREAM_PARSERS = {
+    "statistics": parsers.iter_statistics,
+    "numbers": parsers.iter_numbers
+}
+# Chunk sizes the streaming parsers are checked at; 1 and 7 split UTF-8 characters and tags
+STREAM_CHUNK_SIZES = (1, 7, 64, 4096)
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of samples."""
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def summarize(name, samples, payload_bytes, peak_bytes):
+    """Build a result row from per-call latencies in seconds."""
+    total = sum(samples)
+    return {
+        "name": name,
+        "calls": len(samples),
+        "ops_per_sec": len(samples) / total if total else 0.0,
+        "mb_per_sec": payload_bytes * len(samples) / total / 1e6 if total else 0.0,
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+        "mean_ms": statistics.mean(samples) * 1000,
+        "peak_kb": peak_bytes / 1024
+    }
+
+def measure_peak(func, *args):
+    """Peak Python memory allocated by one call, in bytes."""
+    tracemalloc.start()
+    try:
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+def bench_parser(name, func, payload, iterations, backend=None, payload_bytes=None):
+    """Time a parser on one payload."""
+    args = (payload,) if backend is None else (payload, backend)
+    func(*args)
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func(*args)
+        samples.append(time.perf_counter() - start)
+    if payload_bytes is None:
+        payload_bytes = len(payload)
+    return summarize(name, samples, payload_bytes, measure_peak(func, *args))
+
+def synthetic_payloads(size):
+    """Synthetic responses for an account with `size` ranges."""
+    account = synthetic.make_account(size, 5, seed=size)
+    range_names = list(account)
+    numbers_account = synthetic.make_account(1, size * 5, seed=size + 1)
+    numbers_range = next(iter(numbers_account))
+    messages_account = synthetic.make_account(1, 1, messages_per_number=min(size, 100), seed=size + 2)
+    messages = next(iter(next(iter(messages_account.values())).values()))["messages"]
+    test_sms = [
+        {"range": range_names[i % len(range_names)], "termination": {"test_number": "0"},
+         "originator": "WhatsApp", "messagedata": "code", "senttime": "2026-01-01 00:00:00"}
+        for i in range(size * 5)
+    ]
+    return {
+        "statistics": synthetic.render_statistics(synthetic.account_statistics(account)),
+        "numbers": synthetic.render_numbers(synthetic.account_numbers(numbers_account, numbers_range)),
+        "messages": synthetic.render_messages(messages),
+        "active": synthetic.render_active(range_names, size * 5),
+        "ranges": synthetic.render_ranges_json(test_sms)
+    }
+
+async def _chunks(data, size):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+async def _collect_stream(parse, payload, backend, size):
+    return [item async for item in parse(_chunks(payload.encode("utf-8"), size), backend)]
+
+def check_parity(sizes):
+    """Compare every parser backend against bs4 on fixtures and synthetic pages.
+
+    The streaming parsers are also fed each page in STREAM_CHUNK_SIZES chunks.
+    """
+    backends = [name for name in ("lxml",) if parsers.etree is not None]
+    if not backends:
+        print("Parity: lxml not installed, only the bs4 backend is available")
+        return True
+
+    documents = []
+    for path in sorted(glob.glob(os.path.join(FIXTURE_DIR, "*.html"))):
+        kind = os.path.basename(path).split(".")[0].split("_")[0]
+        if kind in FIXTURE_PARSERS:
+            with open(path, encoding="utf-8") as f:
+                documents.append((os.path.basename(path), kind, f.read()))
+    for size in sizes:
+        for kind, payload in synthetic_payloads(size).items():
+            if kind in FIXTURE_PARSERS:
+                documents.append((f"synthetic {kind} x{size}", kind, payload))
+
+    ok = True
+    for label, kind, payload in documents:
+        expected = FIXTURE_PARSERS[kind](payload, "bs4")
+        for backend in backends:
+            if FIXTURE_PARSERS[kind](payload, backend) != expected:
+                print(f"Parity MISMATCH: {backend} on {label}")
+                ok = False
+            if kind not in STREAM_PARSERS:
+                continue
+            for size in STREAM_CHUNK_SIZES:
+                if asyncio.run(_collect_stream(STREAM_PARSERS[kind], payload, backend, size)) != expected:
+                    print(f"Parity MISMATCH: streamed {backend} in {size} byte chunks on {label}")
+                    ok = False
+    print(f"Parity: {len(documents)} documents checked against bs4, "
+          f"streamed in {'/'.join(map(str, STREAM_CHUNK_SIZES))} byte chunks: {'OK' if ok else 'FAILED'}")
+    return ok
+
+def mock_portal(account, latency, cache):
+    """An httpx transport answering the scraping endpoints from a synthetic account.
+
+    Rendered pages are kept in cache so rendering cost stays out of the timings;
+    clear it after changing the account.
+    """
+    def render(path, form):
+        if path.endswith("/getsms"):
+            return synthetic.render_statistics(synthetic.account_statistics(account))
+        if path.endswith("/getsms/number"):
+            return synthetic.render_numbers(synthetic.account_numbers(account, form["range"]))
+        if path.endswith("/getsms/number/sms"):
+            return synthetic.render_messages(account[form["Range"]][form["Number"]]["messages"])
+        return None
+
+    async def handler(request):
+        if latency:
+            await asyncio.sleep(latency)
+        path = request.url.path
+        form = dict(urllib.parse.parse_qsl(request.content.decode())) if not path.endswith("/getsms") else {}
+        key = (path, tuple(sorted(form.items())))
+        if key not in cache:
+            cache[key] = render(path, form)
+        if cache[key] is None:
+            return httpx.Response(404)
+        return httpx.Response(200, text=cache[key])
+    return httpx.MockTransport(handler)
+
+async def run_cycle(client, limiter, previous, tracker):
+    """One monitor cycle: payload_4, parse_statistics and the incremental crawl."""
+    response = await payload_4(client, "token", "01/01/2026", "01/02/2026")
+    new_ranges = parsers.parse_statistics(response.text)
+    return await crawl_statistics(client, limiter, "token", "01/02/2026", previous, new_ranges, tracker)
+
+async def measure_cycle_peak(client, limiter, previous, tracker):
+    """Run one cycle under tracemalloc and return (previous, peak bytes)."""
+    tracemalloc.start()
+    try:
+        previous, _ = await run_cycle(client, limiter, previous, tracker)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return previous, peak
+
+def add_sms(account, changed, seed):
+    """Give the first number of the first `changed` ranges a new message."""
+    for range_name in list(account)[:changed]:
+        number = next(iter(account[range_name]))
+        account[range_name][number]["messages"].insert(0, synthetic.make_message(random.Random(seed), datetime(2026, 1, 2)))
+
+async def bench_cycles(size, iterations, changed, latency):
+    """Time quiet and busy end-to-end cycles for an account with `size` ranges."""
+    account = synthetic.make_account(size, 5, seed=size)
+    limiter = RequestLimiter()
+    results = []
+    cache = {}
+    async with httpx.AsyncClient(transport=mock_portal(account, latency, cache)) as client:
+        tracker = {}
+        previous = {r["range_name"]: r for r in synthetic.account_statistics(account)}
+
+        quiet = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            previous, _ = await run_cycle(client, limiter, previous, tracker)
+            quiet.append(time.perf_counter() - start)
+        previous, peak = await measure_cycle_peak(client, limiter, previous, tracker)
+        results.append(summarize(f"cycle quiet x{size}", quiet, 0, peak))
+
+        busy = []
+        for i in range(iterations):
+            add_sms(account, changed, i)
+            cache.clear()
+            start = time.perf_counter()
+            previous, _ = await run_cycle(client, limiter, previous, tracker)
+            busy.append(time.perf_counter() - start)
+        add_sms(account, changed, iterations)
+        cache.clear()
+        previous, peak = await measure_cycle_peak(client, limiter, previous, tracker)
+        results.append(summarize(f"cycle busy x{size} ({min(changed, size)} changed)", busy, 0, peak))
+    return results
+
+def print_table(rows):
+    header = f"{'benchmark':<34} {'calls':>6} {'ops/s':>10} {'MB/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'peak KB':>9}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(
+            f"{row['name']:<34} {row['calls']:>6} {row['ops_per_sec']:>10.1f} {row['mb_per_sec']:>8.2f} "
+            f"{row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f} {row['peak_kb']:>9.0f}"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ivasms parsers and monitor cycle on synthetic data.")
+    parser.add_argument("--sizes", default="10,100,1000", help="comma-separated range counts")
+    parser.add_argument("--iterations", type=int, default=20, help="timed calls per benchmark")
+    parser.add_argument("--backend", choices=["bs4", "lxml", "all"], default="all", help="parser backend to time")
+    parser.add_argument("--changed", type=int, default=5, help="ranges receiving an SMS per busy cycle")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated portal latency in seconds")
+    parser.add_argument("--skip-cycle", action="store_true", help="only benchmark the parsers")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    if not check_parity(sizes):
+        raise SystemExit(1)
+
+    backends = ["bs4", "lxml"] if args.backend == "all" else [args.backend]
+    if parsers.etree is None:
+        backends = [b for b in backends if b != "lxml"]
+
+    rows = []
+    for size in sizes:
+        payloads = synthetic_payloads(size)
+        for backend in backends:
+            for kind in ("statistics", "numbers", "messages", "active"):
+                rows.append(bench_parser(f"{kind} x{size} [{backend}]", FIXTURE_PARSERS[kind], payloads[kind], args.iterations, backend))
+        ranges_json = json.loads(payloads["ranges"])
+        rows.append(bench_parser(f"ranges x{size}", parsers.parse_ranges, ranges_json, args.iterations, payload_bytes=len(payloads["ranges"])))
+        if not args.skip_cycle:
+            rows.extend(asyncio.run(bench_cycles(size, args.iterations, args.changed, args.latency)))
+
+    print_table(rows)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=4)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+
+from metrics import SMS_DETECTED
+from parsers import iter_numbers, parse_message, parse_numbers
+from portal import iter_fragment, payload_5, payload_6, stream_payload_5
+from profiler import span
+
+logger = logging.getLogger(__name__)
+
+# Statistics fields that signal new activity in a range
+CHANGE_FIELDS = ("count", "paid", "unpaid")
+# Seconds a fingerprint is remembered after its message is no longer listed
+DEDUP_WINDOW = float(os.getenv("DEDUP_WINDOW", "172800"))
+# Parse statistics and number pages while they download, starting crawls before the body is complete
+STREAM_PARSE = os.getenv("STREAM_PARSE", "0").lower() in ("1", "true", "yes", "on")
+
+def changed_ranges(previous_ranges_dict, new_ranges):
+    """Return ranges that are new or whose count, paid or unpaid totals changed."""
+    changed = []
+    for range_data in new_ranges:
+        previous = previous_ranges_dict.get(range_data["range_name"])
+        if previous is None or any(previous.get(field) != range_data[field] for field in CHANGE_FIELDS):
+            changed.append(range_data)
+    return changed
+
+async def fetch_numbers(client, limiter, csrf_token, to_date, range_name):
+    """Fetch and parse the numbers of a range."""
+    async with limiter.slot():
+        with span("payload_5", range=range_name):
+            response = await payload_5(client, csrf_token, to_date, range_name)
+    logger.debug(f"Payload 5 response status: {response.status_code}")
+    with span("parse_numbers", range=range_name):
+        return parse_numbers(response.text)
+
+async def stream_numbers(client, limiter, csrf_token, to_date, range_name):
+    """Yield the numbers of a range as they are parsed from the streamed response."""
+    async with limiter.slot():
+        with span("payload_5_stream", range=range_name):
+            async with stream_payload_5(client, csrf_token, to_date, range_name) as response:
+                async for number_data in iter_numbers(iter_fragment(response)):
+                    yield number_data
+
+async def aiterate(items):
+    """Iterate a list and an async iterator alike."""
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+async def _abandon(tasks):
+    """Cancel tasks started for a listing that failed and wait for them to finish."""
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+async def fetch_messages(client, limiter, csrf_token, to_date, range_name, number):
+    """Fetch and parse the messages of a number."""
+    async with limiter.slot():
+        with span("payload_6", range=range_name, number=number):
+            response = await payload_6(client, csrf_token, to_date, number, range_name)
+    logger.debug(f"Payload 6 response status: {response.status_code}")
+    with span("parse_message", number=number):
+        return parse_message(response.text)
+
+def message_fingerprint(number, msg):
+    """Short stable hash of (number, timestamp, message), kept instead of the text."""
+    key = f"{number}\x1f{msg['timestamp']}\x1f{msg['message']}"
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=8).hexdigest()
+
+def new_messages(range_tracker, number, messages):
+    """Return the messages of a number whose fingerprint has not been seen, in page order."""
+    entry = range_tracker.get(number)
+    if entry is None:
+        return list(messages)
+    if not entry["fingerprints"] and entry["message_count"]:
+        # Tracked before fingerprints were kept: trust the count this once
+        return messages[:max(len(messages) - entry["message_count"], 0)]
+    return [msg for msg in messages if message_fingerprint(number, msg) not in entry["fingerprints"]]
+
+def record_messages(range_tracker, number_data, messages):
+    """Record a number's messages in the tracker and return the new ones, oldest first.
+
+    Fingerprints of listed messages are always kept; the others expire once
+    they are older than DEDUP_WINDOW.
+    """
+    number = number_data["number"]
+    new = new_messages(range_tracker, number, messages)
+    now = time.time()
+    entry = range_tracker.setdefault(number, {
+        "number_id": number_data["number_id"],
+        "message_count": 0,
+        "fingerprints": {},
+        "updated_at": now
+    })
+    listed = {message_fingerprint(number, msg) for msg in messages}
+    fingerprints = {
+        fingerprint: seen_at for fingerprint, seen_at in entry["fingerprints"].items()
+        if fingerprint in listed or seen_at > now - DEDUP_WINDOW
+    }
+    for fingerprint in listed:
+        fingerprints.setdefault(fingerprint, now)
+    if fingerprints != entry["fingerprints"] or entry["message_count"] != len(messages):
+        entry["message_count"] = len(messages)
+        entry["fingerprints"] = fingerprints
+        entry["updated_at"] = now
+    # The portal lists newest first; keep that order reversed for equal timestamps
+    return sorted(reversed(new), key=lambda msg: msg["timestamp"])
+
+async def crawl_range(client, limiter, csrf_token, to_date, range_data, previous_range, range_tracker, full_scan=False,
+                      listed=None):
+    """Crawl one changed range and return its new SMS, oldest first.
+
+    Numbers missing from the tracker are fetched first, each as soon as it is
+    listed (with STREAM_PARSE, while the rest of the list still downloads).
+    Already-known numbers are only fetched when the unseen messages found so
+    far do not account for the whole count increase, or always with
+    full_scan. The tracker is updated only once every fetch has succeeded
+    and, when given, the listed event is set, and numbers no longer listed
+    for the range (returned numbers) are dropped. In a range we already had
+    statistics for, numbers without tracker history only contribute the
+    newest messages the count increase leaves unexplained.
+    """
+    range_name = range_data["range_name"]
+    previous_count = previous_range["count"] if previous_range else 0
+    expected = range_data["count"] - previous_count
+
+    if STREAM_PARSE:
+        listing = stream_numbers(client, limiter, csrf_token, to_date, range_name)
+    else:
+        listing = await fetch_numbers(client, limiter, csrf_token, to_date, range_name)
+
+    numbers, unknown, pending = [], [], []
+    try:
+        async for number_data in aiterate(listing):
+            numbers.append(number_data)
+            if number_data["number"] not in range_tracker:
+                unknown.append(number_data)
+                pending.append(asyncio.ensure_future(
+                    fetch_messages(client, limiter, csrf_token, to_date, range_name, number_data["number"])
+                ))
+    except BaseException:
+        await _abandon(pending)
+        raise
+    known = [n for n in numbers if n["number"] in range_tracker]
+
+    results = []
+    found = 0
+    for batch in (unknown, known):
+        if not batch or (batch is known and found >= expected and not full_scan):
+            continue
+        if batch is unknown:
+            batch_messages = await asyncio.gather(*pending)
+        else:
+            batch_messages = await asyncio.gather(*(
+                fetch_messages(client, limiter, csrf_token, to_date, range_name, n["number"])
+                for n in batch
+            ))
+        for number_data, messages in zip(batch, batch_messages):
+            found += len(new_messages(range_tracker, number_data["number"], messages))
+            results.append((number_data, messages))
+
+    if listed is not None:
+        # Record nothing until the statistics listing this crawl started from is complete
+        await listed.wait()
+
+    new_sms, untracked_sms = [], []
+    detected_at = time.time()
+    for number_data, messages in results:
+        found_in = untracked_sms if number_data["number"] not in range_tracker else new_sms
+        for msg_data in record_messages(range_tracker, number_data, messages):
+            found_in.append({
+                "timestamp": msg_data["timestamp"],
+                "number": number_data["number"],
+                "message": msg_data["message"],
+                "range": range_name,
+                "revenue": msg_data["revenue"],
+                "detected_at": detected_at
+            })
+
+    listed_numbers = {n["number"] for n in numbers}
+    for number in [n for n in range_tracker if n not in listed_numbers]:
+        logger.info(f"Number {number} is no longer listed in {range_name}, dropping it from the tracker")
+        del range_tracker[number]
+
+    if previous_range is not None:
+        # Without tracker history only the newest count increase is forwarded
+        untracked_sms.sort(key=lambda sms: sms["timestamp"])
+        keep = max(expected - len(new_sms), 0)
+        if len(untracked_sms) > keep:
+            logger.info(f"Skipping {len(untracked_sms) - keep} older messages of numbers new to the tracker in {range_name}")
+            untracked_sms = untracked_sms[-keep:] if keep else []
+    new_sms.extend(untracked_sms)
+    new_sms.sort(key=lambda sms: sms["timestamp"])
+    return new_sms
+
+async def crawl_statistics(client, limiter, csrf_token, to_date, previous_ranges_dict, new_ranges, number_tracker,
+                           full_scan=False):
+    """Crawl the ranges that changed since the previous statistics snapshot.
+
+    new_ranges is a list, or an async iterator of ranges still being parsed
+    from a streamed response; each range is crawled as soon as it arrives.
+    With full_scan every range and every listed number is crawled, whether
+    its statistics changed or not; the fingerprint index still decides which
+    messages are new. Returns the snapshot to compare against next cycle and
+    the list of new SMS. Ranges whose crawl failed keep their previous
+    statistics so they are retried on the next cycle.
+    """
+    snapshot = {}
+    changed, crawled, tasks = [], [], []
+    listed = asyncio.Event()
+    try:
+        async for range_data in aiterate(new_ranges):
+            range_name = range_data["range_name"]
+            snapshot[range_name] = range_data
+            if changed_ranges(previous_ranges_dict, [range_data]):
+                changed.append(range_data)
+            elif not full_scan:
+                continue
+            crawled.append(range_data)
+            tasks.append(asyncio.ensure_future(crawl_range(
+                client, limiter, csrf_token, to_date, range_data,
+                previous_ranges_dict.get(range_name),
+                number_tracker.setdefault(range_name, {}),
+                full_scan, listed
+            )))
+    except BaseException:
+        await _abandon(tasks)
+        raise
+    listed.set()
+    if not crawled:
+        return snapshot, []
+    if full_scan:
+        logger.info(f"Full scan of {len(snapshot)} ranges, {len(changed)} changed")
+    else:
+        logger.info(f"{len(changed)} of {len(snapshot)} ranges changed")
+
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    new_sms = []
+    for range_data, result in zip(crawled, results):
+        range_name = range_data["range_name"]
+        previous = previous_ranges_dict.get(range_name)
+        if isinstance(result, BaseException):
+            logger.error(f"Crawl failed for {range_name}: {str(result)}")
+            if previous:
+                snapshot[range_name] = previous
+            else:
+                snapshot.pop(range_name)
+            continue
+        if previous is None:
+            logger.info(f"New range detected: {range_name}")
+        elif previous["count"] != range_data["count"]:
+            logger.info(f"Count updated for {range_name}: {previous['count']} -> {range_data['count']}")
+        new_sms.extend(result)
+    SMS_DETECTED.inc(len(new_sms))
+    return snapshot, new_sms
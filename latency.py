@@ -0,0 +1,125 @@
+import collections
+import logging
+import math
+import os
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from metrics import SMS_LATENCY_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Timezone of the timestamps shown on the portal (empty = server local time)
+PORTAL_TIMEZONE = os.getenv("PORTAL_TIMEZONE", "")
+PORTAL_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Number of recent SMS the percentile summaries are computed over
+LATENCY_WINDOW = int(os.getenv("LATENCY_WINDOW", "1000"))
+# Seconds between latency summaries in the log
+LATENCY_LOG_INTERVAL = float(os.getenv("LATENCY_LOG_INTERVAL", "600"))
+
+# Stage name and the two timestamps it spans
+STAGES = (
+    ("detection", "portal", "detected"),
+    ("queueing", "detected", "enqueued"),
+    ("delivery", "enqueued", "delivered"),
+    ("end_to_end", "portal", "delivered"),
+)
+
+def parse_portal_time(text, timezone=PORTAL_TIMEZONE):
+    """Epoch seconds of a portal timestamp, or None if it cannot be parsed."""
+    try:
+        when = datetime.strptime(text, PORTAL_TIME_FORMAT)
+    except (TypeError, ValueError):
+        return None
+    if timezone:
+        when = when.replace(tzinfo=ZoneInfo(timezone))
+    return when.timestamp()
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+class LatencyTracker:
+    """Per-SMS timings from the portal timestamp to Telegram delivery.
+
+    Each SMS carries a dict of epoch timestamps (portal, detected, enqueued,
+    delivered) through the sender queue. Once delivered, every stage is
+    observed in SMS_LATENCY_SECONDS and kept for percentile summaries over
+    the last window SMS.
+    """
+
+    def __init__(self, window=LATENCY_WINDOW, log_interval=LATENCY_LOG_INTERVAL):
+        self.samples = {stage: collections.deque(maxlen=window) for stage, _, _ in STAGES}
+        self.log_interval = log_interval
+        self.delivered_total = 0
+        self._last_log = time.monotonic()
+
+    def start(self, sms):
+        """Timings for an SMS being queued for Telegram now."""
+        now = time.time()
+        return {
+            "portal": parse_portal_time(sms.get("timestamp")),
+            "detected": sms.get("detected_at", now),
+            "enqueued": now
+        }
+
+    def delivered(self, timings):
+        """Record SMS delivered together in one Telegram message."""
+        now = time.time()
+        for stamps in timings:
+            if stamps is None:
+                continue
+            stamps["delivered"] = now
+            for stage, begin, end in STAGES:
+                if stamps.get(begin) is None:
+                    continue
+                # Portal timestamps have second resolution and may run slightly ahead
+                elapsed = max(0.0, stamps[end] - stamps[begin])
+                self.samples[stage].append(elapsed)
+                SMS_LATENCY_SECONDS.labels(stage).observe(elapsed)
+            self.delivered_total += 1
+
+    def summary(self):
+        """Count, p50, p90, p99 and max per stage over the recent SMS."""
+        result = {}
+        for stage, values in self.samples.items():
+            if not values:
+                continue
+            ordered = sorted(values)
+            result[stage] = {
+                "count": len(ordered),
+                "p50": percentile(ordered, 0.5),
+                "p90": percentile(ordered, 0.9),
+                "p99": percentile(ordered, 0.99),
+                "max": ordered[-1]
+            }
+        return result
+
+    def _summary_lines(self):
+        summary = self.summary()
+        if not summary:
+            return ["No SMS delivered yet."]
+        lines = [f"SMS latency over the last {max(s['count'] for s in summary.values())} SMS "
+                 f"({self.delivered_total} delivered since start):"]
+        for stage, _, _ in STAGES:
+            if stage in summary:
+                s = summary[stage]
+                lines.append(
+                    f"{stage}: p50 {s['p50']:.1f}s, p90 {s['p90']:.1f}s, p99 {s['p99']:.1f}s, max {s['max']:.1f}s"
+                )
+        return lines
+
+    def format_summary(self):
+        """Human-readable summary for the /stats command."""
+        return "\n".join(self._summary_lines())
+
+    def log_summary(self):
+        """Log the summary once every log_interval seconds."""
+        now = time.monotonic()
+        if now - self._last_log < self.log_interval:
+            return
+        self._last_log = now
+        if any(self.samples.values()):
+            header, *stages = self._summary_lines()
+            logger.info(f"{header} {'; '.join(stages)}")
@@ -0,0 +1,203 @@
+import asyncio
+import bisect
+import contextlib
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Local port serving Prometheus text metrics on /metrics (0 disables the endpoint)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_REGISTRY = []
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+class _CounterValue:
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self, name):
+        yield name, (), self.value
+
+class _GaugeValue:
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set_function(self, function):
+        """Read the value from function at scrape time."""
+        self.function = function
+
+    def samples(self, name):
+        yield name, (), self.function() if self.function else self.value
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    @contextlib.contextmanager
+    def time(self):
+        """Observe the duration of a with block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def samples(self, name):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f"{name}_bucket", (("le", repr(float(bound))),), cumulative
+        yield f"{name}_bucket", (("le", "+Inf"),), self.count
+        yield f"{name}_sum", (), self.sum
+        yield f"{name}_count", (), self.count
+
+class Metric:
+    """A named metric with optional labels, registered for /metrics."""
+
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        _REGISTRY.append(self)
+
+    def labels(self, *values):
+        """Return the value for one combination of label values."""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self._new_value()
+        return child
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in list(self._children.items()):
+            for name, extra, value in child.samples(self.name):
+                lines.append(f"{name}{_format_labels(self.labelnames, key, extra)} {value}")
+        return "\n".join(lines)
+
+class Counter(Metric):
+    kind = "counter"
+
+    def _new_value(self):
+        return _CounterValue()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def _new_value(self):
+        return _GaugeValue()
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def set_function(self, function):
+        self.labels().set_function(function)
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_value(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+# Scraper
+REQUEST_SECONDS = Histogram("ivasms_request_seconds", "ivasms.com request latency including the body", ["method", "endpoint", "status"])
+CONNECTIONS_OPENED = Counter("ivasms_connections_opened_total", "New TCP connections to ivasms.com")
+RESPONSE_BYTES = Counter("ivasms_response_bytes_total", "Bytes downloaded from ivasms.com", ["endpoint"])
+PARSE_SECONDS = Histogram("ivasms_parse_seconds", "Time spent parsing a response", ["parser", "backend"])
+STATISTICS_CACHE = Counter("ivasms_statistics_cache_total", "Statistics responses by fingerprint cache result", ["result"])
+CYCLE_SECONDS = Histogram("ivasms_cycle_seconds", "Duration of one monitor cycle", buckets=(0.1, 0.25, 0.5, 1, 2, 3, 5, 10, 20, 40, 60, 120))
+LOGINS = Counter("ivasms_logins_total", "Login attempts", ["result"])
+SMS_DETECTED = Counter("ivasms_sms_detected_total", "New SMS found on the portal")
+
+# Delivery
+SMS_DELIVERED = Counter("telegram_sms_delivered_total", "SMS delivered to Telegram")
+TELEGRAM_MESSAGES = Counter("telegram_messages_total", "Telegram messages by outcome", ["result"])
+TELEGRAM_SEND_SECONDS = Histogram("telegram_send_seconds", "Latency of one Telegram sendMessage call")
+TELEGRAM_QUEUE_DEPTH = Gauge("telegram_queue_depth", "Messages waiting in the outbound queue")
+SMS_LATENCY_SECONDS = Histogram("sms_latency_seconds", "Per-SMS latency from the portal timestamp to Telegram delivery, by stage",
+                                ["stage"], buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300, 600, 1800))
+
+def render():
+    """Render every registered metric in the Prometheus text format."""
+    return "\n".join(metric.render() for metric in _REGISTRY) + "\n"
+
+async def _handle(reader, writer):
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()).strip():
+            pass
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] in ("/", "/metrics"):
+            status, body = "200 OK", render()
+        else:
+            status, body = "404 Not Found", "Not found\n"
+        data = body.encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode("latin-1") + data
+        )
+        await writer.drain()
+    except Exception as e:
+        logger.warning(f"Metrics request failed: {str(e)}")
+    finally:
+        writer.close()
+
+async def start_metrics_server(port=METRICS_PORT, host=METRICS_HOST):
+    """Serve /metrics on host:port in the running event loop; a no-op when port is 0."""
+    if not port:
+        return None
+    server = await asyncio.start_server(_handle, host, port)
+    logger.info(f"Metrics available at http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,302 @@
+import argparse
+import hashlib
+import json
+import logging
+import random
+import re
+import secrets
+import statistics
+import threading
+import time
+import urllib.parse
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import synthetic
+
+logger = logging.getLogger(__name__)
+
+SESSION_COOKIE = "ivas_session"
+REF_PATTERN = re.compile(r"ref (\d+)")
+
+class MockPortal:
+    """In-memory stand-in for the ivasms.com portal and the Telegram Bot API.
+
+    SMS arrive at `rate` per second (Poisson). Every generated message carries a
+    "ref N" tag so a sendMessage call can be matched back to the moment the SMS
+    appeared on the portal, giving end-to-end detection-to-Telegram latency.
+    With etag, statistics responses carry an ETag and repeated ones are
+    answered 304 Not Modified.
+    """
+
+    def __init__(self, ranges, numbers, rate, latency, jitter, session_ttl, new_number_ratio, seed, etag=False):
+        self.account = synthetic.make_account(ranges, numbers, seed=seed)
+        self.rate = rate
+        self.latency = latency
+        self.jitter = jitter
+        self.session_ttl = session_ttl
+        self.new_number_ratio = new_number_ratio
+        self.etag = etag
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.next_ref = 1
+        self.next_number_id = sum(len(n) for n in self.account.values()) + 1
+        self.arrivals = {}
+        self.latencies = []
+        self.requests = {}
+        self.telegram_messages = 0
+        self.logins = 0
+        self.not_modified = 0
+
+    def delay(self):
+        """Sleep for the configured portal latency."""
+        if self.latency or self.jitter:
+            time.sleep(max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter)))
+
+    def count_request(self, path):
+        with self.lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def login(self):
+        token = secrets.token_hex(16)
+        with self.lock:
+            self.sessions[token] = time.time()
+            self.logins += 1
+        return token
+
+    def session_valid(self, token):
+        with self.lock:
+            created = self.sessions.get(token)
+            if created is None:
+                return False
+            if self.session_ttl and time.time() - created > self.session_ttl:
+                del self.sessions[token]
+                return False
+            return True
+
+    def add_sms(self):
+        """Deliver one new SMS to a random existing or brand-new number."""
+        with self.lock:
+            ref = self.next_ref
+            self.next_ref += 1
+            range_name = self.rng.choice(list(self.account))
+            numbers = self.account[range_name]
+            if not numbers or self.rng.random() < self.new_number_ratio:
+                number = f"22599{self.next_number_id:08d}"
+                numbers[number] = {"number_id": str(self.next_number_id), "messages": []}
+                self.next_number_id += 1
+            else:
+                number = self.rng.choice(list(numbers))
+            numbers[number]["messages"].insert(0, synthetic.make_message(self.rng, datetime.now(), ref=ref))
+            self.arrivals[ref] = time.time()
+
+    def run_arrivals(self):
+        """Generate SMS forever at the configured rate."""
+        while True:
+            time.sleep(self.rng.expovariate(self.rate))
+            self.add_sms()
+
+    def record_telegram(self, text):
+        """Match the refs in a delivered Telegram message to their arrival time."""
+        now = time.time()
+        with self.lock:
+            self.telegram_messages += 1
+            for ref in REF_PATTERN.findall(text):
+                arrived = self.arrivals.pop(int(ref), None)
+                if arrived is not None:
+                    self.latencies.append(now - arrived)
+
+    def stats(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            summary = {
+                "sms_generated": self.next_ref - 1,
+                "sms_delivered": len(latencies),
+                "sms_pending": len(self.arrivals),
+                "telegram_messages": self.telegram_messages,
+                "logins": self.logins,
+                "not_modified": self.not_modified,
+                "requests": dict(self.requests)
+            }
+        if latencies:
+            summary["latency_seconds"] = {
+                "p50": latencies[len(latencies) // 2],
+                "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+                "max": latencies[-1],
+                "mean": statistics.mean(latencies)
+            }
+        return summary
+
+def make_handler(portal):
+    """Build the request handler class bound to a MockPortal."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+        def send_body(self, status, body, content_type="text/html; charset=UTF-8", headers=None):
+            data = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def send_not_modified(self, etag):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+
+        def redirect(self, location, headers=None):
+            headers = dict(headers or {})
+            headers["Location"] = location
+            self.send_body(302, "", headers=headers)
+
+        def read_form(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length).decode("utf-8", "replace") if length else ""
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                return json.loads(body or "{}")
+            return dict(urllib.parse.parse_qsl(body))
+
+        def session_token(self):
+            cookies = self.headers.get("Cookie", "")
+            match = re.search(rf"{SESSION_COOKIE}=([0-9a-f]+)", cookies)
+            return match.group(1) if match else None
+
+        def do_GET(self):
+            self.route("GET")
+
+        def do_POST(self):
+            self.route("POST")
+
+        def route(self, method):
+            parsed = urllib.parse.urlsplit(self.path)
+            path = parsed.path
+            if path.startswith("/bot"):
+                return self.telegram(path, self.read_form() if method == "POST" else {})
+            if path == "/mock/stats":
+                return self.send_body(200, json.dumps(portal.stats(), indent=4), "application/json")
+
+            form = self.read_form() if method == "POST" else {}
+            portal.count_request(path)
+            portal.delay()
+
+            if path == "/login" and method == "GET":
+                return self.send_body(200, '<form method="POST"><input type="hidden" name="_token" value="mocktoken">'
+                                           '<input type="email" name="email"><input type="password" name="password"></form>')
+            if path == "/login" and method == "POST":
+                token = portal.login()
+                return self.redirect("/portal", {"Set-Cookie": f"{SESSION_COOKIE}={token}; Path=/; HttpOnly"})
+            if not path.startswith("/portal"):
+                return self.send_body(404, "Not found")
+            if not portal.session_valid(self.session_token()):
+                return self.redirect("/login")
+
+            with portal.lock:
+                body, content_type = self.portal_page(method, path, form, parsed.query)
+            if body is None:
+                return self.send_body(404, "Not found")
+            if portal.etag and path == "/portal/sms/received/getsms":
+                etag = f'"{hashlib.blake2b(body.encode("utf-8"), digest_size=8).hexdigest()}"'
+                if self.headers.get("If-None-Match") == etag:
+                    with portal.lock:
+                        portal.not_modified += 1
+                    return self.send_not_modified(etag)
+                return self.send_body(200, body, content_type, {"ETag": etag})
+            return self.send_body(200, body, content_type)
+
+        def portal_page(self, method, path, form, query):
+            account = portal.account
+            if path == "/portal":
+                return "<html><body>Dashboard</body></html>", "text/html; charset=UTF-8"
+            if path == "/portal/sms/received":
+                return '<html><head><meta name="csrf-token" content="mockcsrf"></head><body></body></html>', "text/html; charset=UTF-8"
+            if path == "/portal/sms/received/getsms" and method == "POST":
+                return synthetic.render_statistics(synthetic.account_statistics(account)), "text/html; charset=UTF-8"
+            if path == "/portal/sms/received/getsms/number" and method == "POST":
+                return synthetic.render_numbers(synthetic.account_numbers(account, form.get("range"))), "text/html; charset=UTF-8"
+            if path == "/portal/sms/received/getsms/number/sms" and method == "POST":
+                number = account.get(form.get("Range"), {}).get(form.get("Number"))
+                return synthetic.render_messages(number["messages"] if number else []), "text/html; charset=UTF-8"
+            if path == "/portal/live/my_sms":
+                total = sum(len(numbers) for numbers in account.values())
+                return synthetic.render_active(list(account), total), "text/html; charset=UTF-8"
+            if path == "/portal/sms/test/sms":
+                test_sms = [
+                    {"range": range_name, "termination": {"test_number": number}, "originator": "WhatsApp",
+                     "messagedata": data["messages"][0]["message"], "senttime": data["messages"][0]["timestamp"]}
+                    for range_name, numbers in account.items()
+                    for number, data in list(numbers.items())[:1] if data["messages"]
+                ]
+                return synthetic.render_ranges_json(test_sms), "application/json"
+            if path.startswith("/portal/numbers/return/"):
+                return json.dumps({"message": "Numbers returned"}), "application/json"
+            return None, None
+
+        def telegram(self, path, params):
+            """Minimal Bot API: enough for python-telegram-bot polling and sendMessage."""
+            method = path.rsplit("/", 1)[-1]
+            if method == "getMe":
+                result = {"id": 1, "is_bot": True, "first_name": "Mock", "username": "mock_bot",
+                          "can_join_groups": True, "can_read_all_group_messages": False, "supports_inline_queries": False}
+            elif method == "getUpdates":
+                time.sleep(min(float(params.get("timeout") or 0), 10))
+                result = []
+            elif method == "sendMessage":
+                text = params.get("text", "")
+                portal.record_telegram(text)
+                chat_id = params.get("chat_id", "0")
+                try:
+                    chat_id = int(chat_id)
+                except (TypeError, ValueError):
+                    chat_id = 0
+                result = {"message_id": portal.telegram_messages, "date": int(time.time()),
+                          "chat": {"id": chat_id, "type": "group", "title": "Mock"}, "text": text}
+            else:
+                result = True
+            self.send_body(200, json.dumps({"ok": True, "result": result}), "application/json")
+
+    return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for ivasms.com and the Telegram Bot API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--ranges", type=int, default=20, help="initial number of ranges")
+    parser.add_argument("--numbers", type=int, default=10, help="initial numbers per range")
+    parser.add_argument("--rate", type=float, default=1.0, help="new SMS per second")
+    parser.add_argument("--new-number-ratio", type=float, default=0.5, help="share of SMS arriving on a new number")
+    parser.add_argument("--latency", type=float, default=0.05, help="portal response latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.02, help="random +/- latency in seconds")
+    parser.add_argument("--session-ttl", type=float, default=0, help="expire portal sessions after this many seconds (0 = never)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--etag", action="store_true", help="send ETags with statistics and answer repeats with 304")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    portal = MockPortal(args.ranges, args.numbers, args.rate, args.latency, args.jitter,
+                        args.session_ttl, args.new_number_ratio, args.seed, args.etag)
+    if args.rate > 0:
+        threading.Thread(target=portal.run_arrivals, daemon=True).start()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(portal))
+    base = f"http://{args.host}:{args.port}"
+    logger.info(f"Mock portal listening on {base}")
+    logger.info(f"Run the monitor with IVASMS_BASE_URL={base} TELEGRAM_BASE_URL={base}/bot")
+    logger.info(f"Delivery latency summary: {base}/mock/stats")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logger.info(f"Final stats: {json.dumps(portal.stats())}")
+
+if __name__ == "__main__":
+    main()
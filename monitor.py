@@ -0,0 +1,219 @@
+import asyncio
+import logging
+import os
+import time
+
+from crawler import STREAM_PARSE, aiterate, crawl_statistics
+from metrics import CYCLE_SECONDS
+from parsers import iter_statistics, parse_statistics
+from portal import iter_fragment, payload_4, stream_payload_4
+from profiler import CycleProfiler, span
+from retries import Backoff, CircuitOpenError
+from scheduler import PollScheduler, RequestBudget
+from session import is_session_expired
+from statistics_cache import StatisticsCache, response_digest
+from transport import RequestCounter, RequestLimiter
+from window import DateWindow
+
+logger = logging.getLogger(__name__)
+
+# How new SMS are found:
+# "statistics" crawls only ranges whose statistics changed, fetching as few numbers as possible;
+# "full" fetches every number of every range each cycle;
+# "hybrid" works like "statistics" with a full scan every FULL_SCAN_INTERVAL seconds
+DETECTION_STRATEGY = os.getenv("DETECTION_STRATEGY", "statistics").lower()
+FULL_SCAN_INTERVAL = float(os.getenv("FULL_SCAN_INTERVAL", "300"))
+
+STRATEGIES = ("statistics", "full", "hybrid")
+
+class AccountMonitor:
+    """Poll the statistics of one ivasms.com account and forward its new SMS.
+
+    Every account has its own session, date window, stored state and poll
+    schedule; the Telegram sender, latency tracker, connection pool, request
+    limiter and request budget are shared by all monitors in the process.
+    notify(sender, sms, latency, chat_id) queues one SMS for Telegram.
+    """
+
+    def __init__(self, account, sessions, store, sender, latency, notify, limiter=None, budget=None,
+                 strategy=DETECTION_STRATEGY, full_scan_interval=FULL_SCAN_INTERVAL):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown detection strategy {strategy!r}, expected one of {', '.join(STRATEGIES)}")
+        self.account = account
+        self.sessions = sessions
+        self.store = store
+        self.sender = sender
+        self.latency = latency
+        self.notify = notify
+        self.strategy = strategy
+        self.full_scan_interval = full_scan_interval
+        self.last_full_scan = time.monotonic()
+        # Date window polled for statistics, rolled over once a day
+        self.window = DateWindow()
+        # Requests of this account, limited together with those of the other accounts
+        self.limiter = RequestCounter(limiter or RequestLimiter())
+        self.scheduler = PollScheduler(budget or RequestBudget(sessions.transport.window))
+        self.backoff = Backoff()
+        self.profiler = CycleProfiler(name=account.name)
+        # Skips parsing and diffing statistics identical to the last fully crawled ones
+        self.statistics_cache = StatisticsCache()
+
+    def full_scan_due(self):
+        """Whether this cycle crawls every number instead of only changed ranges."""
+        if self.strategy == "full":
+            return True
+        if self.strategy == "hybrid" and time.monotonic() - self.last_full_scan >= self.full_scan_interval:
+            self.last_full_scan = time.monotonic()
+            return True
+        return False
+
+    async def poll(self, client, csrf_token, previous_ranges_dict, number_tracker, baseline):
+        """Fetch the statistics and crawl the ranges that need it.
+
+        Returns the parsed ranges, the snapshot to compare against next cycle
+        and the new SMS. With baseline the statistics are only recorded.
+        Statistics identical to the last fully crawled ones are neither
+        parsed nor diffed; full scans always parse.
+        """
+        window = self.window
+        cache = self.statistics_cache
+        full_scan = not baseline and self.full_scan_due()
+        cacheable = not baseline and not full_scan
+        conditional = cache.conditional_headers(previous_ranges_dict) if cacheable else None
+
+        if not STREAM_PARSE:
+            with span("payload_4"):
+                response = await payload_4(client, csrf_token, window.from_date, window.to_date, conditional)
+            logger.debug(f"Payload 4 response status: {response.status_code}")
+            digest = response_digest(response)
+            if cacheable:
+                cached = cache.lookup(previous_ranges_dict, response, digest)
+                if cached is not None:
+                    return cached, previous_ranges_dict, []
+            with span("parse_statistics"):
+                new_ranges = parse_statistics(response.text)
+            snapshot, new_sms = await self.crawl(client, csrf_token, previous_ranges_dict, new_ranges, number_tracker, baseline, full_scan)
+            cache.store(response, digest, new_ranges, snapshot)
+            return new_ranges, snapshot, new_sms
+
+        # Ranges are crawled as they are parsed, while the statistics are still downloading
+        new_ranges = []
+
+        async def listed(ranges):
+            async for range_data in ranges:
+                new_ranges.append(range_data)
+                yield range_data
+
+        with span("payload_4_stream"):
+            async with stream_payload_4(client, csrf_token, window.from_date, window.to_date, conditional) as response:
+                logger.debug(f"Payload 4 response status: {response.status_code}")
+                # The body is parsed as it arrives, so only the ETag/Last-Modified validators can skip it
+                if cacheable:
+                    cached = cache.lookup(previous_ranges_dict, response)
+                    if cached is not None:
+                        return cached, previous_ranges_dict, []
+                ranges = listed(iter_statistics(iter_fragment(response)))
+                snapshot, new_sms = await self.crawl(client, csrf_token, previous_ranges_dict, ranges, number_tracker, baseline, full_scan)
+        cache.store(response, None, new_ranges, snapshot)
+        return new_ranges, snapshot, new_sms
+
+    async def crawl(self, client, csrf_token, previous_ranges_dict, ranges, number_tracker, baseline, full_scan):
+        if baseline:
+            return {r["range_name"]: r async for r in aiterate(ranges)}, []
+        # Crawl the ranges whose statistics changed, or all of them on a full scan
+        with span("crawl_statistics", full_scan=full_scan):
+            return await crawl_statistics(
+                client, self.limiter, csrf_token, self.window.to_date,
+                previous_ranges_dict, ranges, number_tracker, full_scan
+            )
+
+    async def run(self):
+        """Monitor the account until cancelled."""
+        account, sessions, store, window = self.account, self.sessions, self.store, self.window
+        limiter, scheduler, backoff, profiler = self.limiter, self.scheduler, self.backoff, self.profiler
+
+        logger.info(f"[{account.name}] Monitoring with the {self.strategy} detection strategy"
+                    f"{', streaming responses' if STREAM_PARSE else ''}")
+        existing_ranges_dict = store.load_ranges()
+        number_tracker = store.tracker()
+        stored_window = store.get_meta("window")
+        if stored_window and stored_window != window.key:
+            logger.info(f"[{account.name}] Stored statistics are for {stored_window}, starting a new baseline for {window.key}")
+            existing_ranges_dict = {}
+
+        # Use the first statistics fetched as the baseline when nothing is stored yet
+        needs_baseline = not existing_ranges_dict and stored_window is None
+
+        while True:
+            try:
+                cycle_start = time.perf_counter()
+                profiler.start_cycle()
+
+                # Statistics of a new day start from zero, so every range is crawled once against the dedup index
+                if window.refresh():
+                    existing_ranges_dict = {}
+                    needs_baseline = False
+
+                # Borrow the shared session, logging in only if it expired
+                with span("session"):
+                    client, csrf_token = await sessions.ensure()
+
+                # Fetch updated statistics and crawl what changed; an expired session shows up in the statistics
+                previous_ranges_dict = existing_ranges_dict
+                requests_before = limiter.requests
+                try:
+                    new_ranges, existing_ranges_dict, new_sms = await self.poll(
+                        client, csrf_token, previous_ranges_dict, number_tracker, needs_baseline
+                    )
+                except Exception as e:
+                    if not is_session_expired(e):
+                        raise
+                    sessions.invalidate(client)
+                    continue
+                needs_baseline = False
+
+                with span("send_to_telegram", count=len(new_sms)):
+                    for sms in new_sms:
+                        logger.info(f"[{account.name}] New SMS: {sms}")
+                        self.notify(self.sender, sms, self.latency, account.chat_id)
+
+                # Queue the changes; they are written once STORE_FLUSH_INTERVAL has passed
+                with span("save"):
+                    store.save_cycle(existing_ranges_dict, number_tracker, new_sms, force=stored_window != window.key)
+                if stored_window != window.key:
+                    store.set_meta("window", window.key)
+                    stored_window = window.key
+
+                # Poll again sooner after activity and back off while quiet
+                scheduler.update(previous_ranges_dict, new_ranges, 1 + limiter.requests - requests_before)
+                CYCLE_SECONDS.observe(time.perf_counter() - cycle_start)
+                profiler.end_cycle()
+                backoff.reset()
+                self.latency.log_summary()
+                await asyncio.sleep(scheduler.next_delay())
+
+            except CircuitOpenError as e:
+                logger.warning(f"[{account.name}] {str(e)}")
+                profiler.end_cycle()
+                await asyncio.sleep(e.retry_in)
+
+            except Exception as e:
+                logger.error(f"[{account.name}] Error in main loop: {str(e)}. Response content: {getattr(e, 'response', 'No response')}")
+                profiler.end_cycle()
+                # Exponential backoff with jitter, reset after the next good cycle
+                retry_delay = backoff.next_delay()
+                logger.info(f"[{account.name}] Retrying in {retry_delay:.1f} seconds...")
+                await asyncio.sleep(retry_delay)
+
+async def run_monitors(monitors):
+    """Run every account monitor on the current event loop.
+
+    A monitor that crashes is logged and the others keep running.
+    """
+    async def run_logged(monitor):
+        try:
+            await monitor.run()
+        except Exception as e:
+            logger.error(f"[{monitor.account.name}] Monitor stopped: {str(e)}")
+
+    await asyncio.gather(*(run_logged(monitor) for monitor in monitors))
@@ -0,0 +1,411 @@
+import re
+import os
+import logging
+import time
+from bs4 import BeautifulSoup
+
+from metrics import PARSE_SECONDS
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+logger = logging.getLogger(__name__)
+
+# Parser backend: "lxml" (C-based, default when installed) or "bs4" (BeautifulSoup)
+PARSER_BACKEND = os.getenv("PARSER_BACKEND", "lxml" if etree is not None else "bs4").lower()
+if PARSER_BACKEND == "lxml" and etree is None:
+    logger.warning("lxml is not installed, falling back to the bs4 parser backend")
+    PARSER_BACKEND = "bs4"
+
+# Class matchers shared by both backends
+COL_PATTERN = re.compile(r'col-sm-\d+|col-\d+')
+ACTIVE_LINK_PATTERN = re.compile(r'd-block w-100')
+MY_NUMBERS_PATTERN = re.compile(r'My Numbers')
+RANGE_CARD_CLASS = 'card card-body mb-1 pointer'
+NUMBER_CARD_CLASS = 'card card-body border-bottom bg-100 p-2 rounded-0'
+MESSAGE_CLASS = 'col-9 col-sm-6 text-center text-sm-start'
+REVENUE_CLASS = 'col-3 col-sm-2 text-center text-sm-start'
+TIMESTAMP_CLASS = 'col-12 col-sm-4 text-center text-sm-start'
+
+def _build_range(range_name, count_text, paid_text, unpaid_text, revenue_text, onclick):
+    """Build a range dict from the text extracted from a statistics card."""
+    try:
+        count = int(count_text) if count_text else 0
+        paid = int(paid_text) if paid_text else 0
+        unpaid = int(unpaid_text) if unpaid_text else 0
+        revenue = float(revenue_text) if revenue_text else 0.0
+    except ValueError as e:
+        logger.warning(f"Error parsing values for {range_name}: {str(e)}")
+        count, paid, unpaid, revenue = 0, 0, 0, 0.0
+
+    range_id_match = re.search(r"getDetials\('([^']+)'\)", onclick)
+    range_id = range_id_match.group(1) if range_id_match else range_name
+
+    return {
+        "range_name": range_name,
+        "range_id": range_id,
+        "count": count,
+        "paid": paid,
+        "unpaid": unpaid,
+        "revenue": revenue
+    }
+
+def _build_number(onclick):
+    """Build a number dict from a number card's onclick handler, or None."""
+    match = re.search(r"'([^']+)','([^']+)'", onclick)
+    if not match:
+        logger.warning(f"Failed to parse onclick: {onclick}")
+        return None
+    number, number_id = match.groups()
+    return {"number": number, "number_id": number_id}
+
+def _bs4_statistics(response_text):
+    soup = BeautifulSoup(response_text, 'html.parser')
+    ranges = []
+
+    no_sms = soup.find('p', id='messageFlash')
+    if no_sms and "You do not have any SMS" in no_sms.text:
+        logger.info("No SMS data found in response")
+        return ranges
+
+    range_cards = soup.find_all('div', class_=RANGE_CARD_CLASS)
+    for card in range_cards:
+        cols = card.find_all('div', class_=COL_PATTERN)
+        if len(cols) >= 5:
+            revenue_span = cols[4].find('span', class_='currency_cdr')
+            ranges.append(_build_range(
+                cols[0].text.strip(),
+                cols[1].find('p').text.strip(),
+                cols[2].find('p').text.strip(),
+                cols[3].find('p').text.strip(),
+                revenue_span.text.strip() if revenue_span else "0.0",
+                card.get('onclick', '')
+            ))
+    return ranges
+
+def _bs4_numbers(response_text):
+    soup = BeautifulSoup(response_text, 'html.parser')
+    numbers = []
+
+    number_divs = soup.find_all('div', class_=NUMBER_CARD_CLASS)
+    for div in number_divs:
+        number_data = _build_number(div.find('div', class_=COL_PATTERN).get('onclick', ''))
+        if number_data:
+            numbers.append(number_data)
+    return numbers
+
+def _bs4_message(response_text):
+    soup = BeautifulSoup(response_text, 'html.parser')
+    messages = []
+
+    for row in soup.find_all('tr'):
+        message_div = row.find('div', class_=MESSAGE_CLASS)
+        revenue_div = row.find('div', class_=REVENUE_CLASS)
+        timestamp_div = row.find('div', class_=TIMESTAMP_CLASS)
+
+        messages.append({
+            "message": message_div.find('p').text.strip() if message_div else "No message found",
+            "revenue": revenue_div.find('span', class_='currency_cdr').text.strip() if revenue_div else "0.0",
+            # Empty when the row has no timestamp, so the message fingerprint stays the same on every fetch
+            "timestamp": timestamp_div.find('p').text.strip() if timestamp_div else ""
+        })
+    return messages
+
+def _bs4_active_data(response_text):
+    soup = BeautifulSoup(response_text, 'html.parser')
+    active_data = {"ranges": [], "total_numbers": 0}
+
+    # Extract ranges from accordion
+    accordion = soup.find('div', id='accordion')
+    if accordion:
+        range_cards = accordion.find_all('div', class_='card card-secondary')
+        for card in range_cards:
+            range_name = card.find('a', class_=ACTIVE_LINK_PATTERN).text.strip()
+            active_data["ranges"].append(range_name)
+
+    # Extract total numbers
+    total_numbers_header = soup.find('h6', class_='mb-0', string=MY_NUMBERS_PATTERN)
+    if total_numbers_header:
+        total_numbers_match = re.search(r'\((\d+)\)', total_numbers_header.text)
+        if total_numbers_match:
+            active_data["total_numbers"] = int(total_numbers_match.group(1))
+
+    return active_data
+
+def _lxml_root(response_text):
+    """Parse response text into an lxml tree, or None for an empty document."""
+    if not response_text or not response_text.strip():
+        return None
+    return etree.HTML(response_text)
+
+def _lxml_class_matches(element, match):
+    """Match an element's class attribute the way BeautifulSoup's class_ filter does."""
+    value = element.get('class')
+    if value is None:
+        return False
+    classes = value.split()
+    joined = " ".join(classes)
+    if isinstance(match, str):
+        return match in classes or joined == match
+    return any(match.search(c) for c in classes) or match.search(joined) is not None
+
+def _lxml_find_all(element, tag, class_=None, **attrs):
+    """Return descendants of element like BeautifulSoup's find_all."""
+    found = []
+    for child in element.iter(tag):
+        if child is element:
+            continue
+        if class_ is not None and not _lxml_class_matches(child, class_):
+            continue
+        if any(child.get(name) != value for name, value in attrs.items()):
+            continue
+        found.append(child)
+    return found
+
+def _lxml_find(element, tag, class_=None, **attrs):
+    """Return the first matching descendant of element, or None."""
+    for child in element.iter(tag):
+        if child is element:
+            continue
+        if class_ is not None and not _lxml_class_matches(child, class_):
+            continue
+        if any(child.get(name) != value for name, value in attrs.items()):
+            continue
+        return child
+    return None
+
+def _lxml_exact_class(element, tag, class_value):
+    """Return descendants whose whole class attribute equals class_value, via XPath."""
+    return element.xpath(f'.//{tag}[normalize-space(@class)=$value]', value=class_value)
+
+def _lxml_text(element):
+    """Concatenated text of an element and its descendants, like BeautifulSoup's .text."""
+    return "".join(element.itertext())
+
+def _lxml_string(element):
+    """The single string inside an element, like BeautifulSoup's .string, or None."""
+    if len(element) == 0:
+        return element.text or None
+    if len(element) == 1 and not element.text and not element[0].tail:
+        child = element[0]
+        if not isinstance(child.tag, str):
+            return child.text
+        return _lxml_string(child)
+    return None
+
+def _lxml_range(card):
+    """Range dict of one statistics card, or None if it is incomplete."""
+    cols = _lxml_find_all(card, 'div', COL_PATTERN)
+    if len(cols) < 5:
+        return None
+    revenue_span = _lxml_find(cols[4], 'span', 'currency_cdr')
+    return _build_range(
+        _lxml_text(cols[0]).strip(),
+        _lxml_text(_lxml_find(cols[1], 'p')).strip(),
+        _lxml_text(_lxml_find(cols[2], 'p')).strip(),
+        _lxml_text(_lxml_find(cols[3], 'p')).strip(),
+        _lxml_text(revenue_span).strip() if revenue_span is not None else "0.0",
+        card.get('onclick', '')
+    )
+
+def _lxml_number(div):
+    """Number dict of one number card, or None."""
+    return _build_number(_lxml_find(div, 'div', COL_PATTERN).get('onclick', ''))
+
+def _lxml_statistics(response_text):
+    root = _lxml_root(response_text)
+    ranges = []
+    if root is None:
+        return ranges
+
+    no_sms = _lxml_find(root, 'p', id='messageFlash')
+    if no_sms is not None and "You do not have any SMS" in _lxml_text(no_sms):
+        logger.info("No SMS data found in response")
+        return ranges
+
+    for card in _lxml_exact_class(root, 'div', RANGE_CARD_CLASS):
+        range_data = _lxml_range(card)
+        if range_data:
+            ranges.append(range_data)
+    return ranges
+
+def _lxml_numbers(response_text):
+    root = _lxml_root(response_text)
+    numbers = []
+    if root is None:
+        return numbers
+
+    for div in _lxml_exact_class(root, 'div', NUMBER_CARD_CLASS):
+        number_data = _lxml_number(div)
+        if number_data:
+            numbers.append(number_data)
+    return numbers
+
+def _lxml_message(response_text):
+    root = _lxml_root(response_text)
+    messages = []
+    if root is None:
+        return messages
+
+    for row in root.iter('tr'):
+        message_div = _lxml_find(row, 'div', MESSAGE_CLASS)
+        revenue_div = _lxml_find(row, 'div', REVENUE_CLASS)
+        timestamp_div = _lxml_find(row, 'div', TIMESTAMP_CLASS)
+
+        messages.append({
+            "message": _lxml_text(_lxml_find(message_div, 'p')).strip() if message_div is not None else "No message found",
+            "revenue": _lxml_text(_lxml_find(revenue_div, 'span', 'currency_cdr')).strip() if revenue_div is not None else "0.0",
+            "timestamp": _lxml_text(_lxml_find(timestamp_div, 'p')).strip() if timestamp_div is not None else ""
+        })
+    return messages
+
+def _lxml_active_data(response_text):
+    root = _lxml_root(response_text)
+    active_data = {"ranges": [], "total_numbers": 0}
+    if root is None:
+        return active_data
+
+    accordion = _lxml_find(root, 'div', id='accordion')
+    if accordion is not None:
+        for card in _lxml_find_all(accordion, 'div', 'card card-secondary'):
+            active_data["ranges"].append(_lxml_text(_lxml_find(card, 'a', ACTIVE_LINK_PATTERN)).strip())
+
+    for header in _lxml_find_all(root, 'h6', 'mb-0'):
+        string = _lxml_string(header)
+        if string is not None and MY_NUMBERS_PATTERN.search(string):
+            total_numbers_match = re.search(r'\((\d+)\)', _lxml_text(header))
+            if total_numbers_match:
+                active_data["total_numbers"] = int(total_numbers_match.group(1))
+            break
+
+    return active_data
+
+_BACKENDS = {
+    "bs4": {
+        "statistics": _bs4_statistics,
+        "numbers": _bs4_numbers,
+        "message": _bs4_message,
+        "active_data": _bs4_active_data
+    },
+    "lxml": {
+        "statistics": _lxml_statistics,
+        "numbers": _lxml_numbers,
+        "message": _lxml_message,
+        "active_data": _lxml_active_data
+    }
+}
+
+def _backend(name):
+    return _BACKENDS[name or PARSER_BACKEND]
+
+def parse_statistics(response_text, backend=None):
+    """Parse SMS statistics from response and return range data."""
+    try:
+        with PARSE_SECONDS.labels("statistics", backend or PARSER_BACKEND).time():
+            return _backend(backend)["statistics"](response_text)
+    except Exception as e:
+        logger.error(f"Parse statistics failed: {str(e)}")
+        raise
+
+def parse_numbers(response_text, backend=None):
+    """Parse numbers from the range response."""
+    try:
+        with PARSE_SECONDS.labels("numbers", backend or PARSER_BACKEND).time():
+            return _backend(backend)["numbers"](response_text)
+    except Exception as e:
+        logger.error(f"Parse numbers failed: {str(e)}")
+        raise
+
+def parse_message(response_text, backend=None):
+    """Parse message details from response."""
+    try:
+        with PARSE_SECONDS.labels("message", backend or PARSER_BACKEND).time():
+            return _backend(backend)["message"](response_text)
+    except Exception as e:
+        logger.error(f"Parse message failed: {str(e)}")
+        raise
+
+async def _lxml_stream_cards(chunks, card_class, build, kind):
+    """Yield build(card) for each card of card_class as soon as its closing tag arrives.
+
+    Finished cards are cleared and unlinked from the tree, so memory stays
+    flat however long the document is.
+    """
+    parser = etree.HTMLPullParser(events=("end",), tag="div", encoding="utf-8")
+    parse_time = 0.0
+
+    def drain():
+        for _, element in parser.read_events():
+            if " ".join((element.get('class') or "").split()) != card_class:
+                continue
+            item = build(element)
+            element.clear(keep_tail=True)
+            parent = element.getparent()
+            if parent is not None:
+                while element.getprevious() is not None:
+                    del parent[0]
+            if item:
+                yield item
+
+    try:
+        async for chunk in chunks:
+            start = time.perf_counter()
+            parser.feed(chunk)
+            items = list(drain())
+            parse_time += time.perf_counter() - start
+            for item in items:
+                yield item
+        start = time.perf_counter()
+        try:
+            parser.close()
+        except etree.XMLSyntaxError:
+            # An empty document has no root element
+            pass
+        items = list(drain())
+        parse_time += time.perf_counter() - start
+        for item in items:
+            yield item
+    finally:
+        PARSE_SECONDS.labels(kind, "lxml_stream").observe(parse_time)
+
+async def _buffered_stream(chunks, parse):
+    """Collect every chunk, then parse the whole document (backends without a pull parser)."""
+    body = b"".join([chunk async for chunk in chunks])
+    for item in parse(body.decode("utf-8", errors="replace")):
+        yield item
+
+def iter_statistics(chunks, backend=None):
+    """Yield range dicts from an async iterator of statistics response bytes as they are parsed."""
+    if (backend or PARSER_BACKEND) != "lxml":
+        return _buffered_stream(chunks, lambda text: parse_statistics(text, backend))
+    return _lxml_stream_cards(chunks, RANGE_CARD_CLASS, _lxml_range, "statistics")
+
+def iter_numbers(chunks, backend=None):
+    """Yield number dicts from an async iterator of range response bytes as they are parsed."""
+    if (backend or PARSER_BACKEND) != "lxml":
+        return _buffered_stream(chunks, lambda text: parse_numbers(text, backend))
+    return _lxml_stream_cards(chunks, NUMBER_CARD_CLASS, _lxml_number, "numbers")
+
+def parse_ranges(response_json):
+    """Parse available ranges from JSON response."""
+    try:
+        ranges = set()
+        for item in response_json.get('data', []):
+            range_name = item.get('range', '')
+            if range_name:
+                ranges.add(range_name)
+        return sorted(list(ranges))
+    except Exception as e:
+        logger.error(f"Parse ranges failed: {str(e)}")
+        return []
+
+def parse_active_data(response_text, backend=None):
+    """Parse active SMS data from /portal/live/my_sms response."""
+    try:
+        with PARSE_SECONDS.labels("active_data", backend or PARSER_BACKEND).time():
+            return _backend(backend)["active_data"](response_text)
+    except Exception as e:
+        logger.error(f"Parse active data failed: {str(e)}")
+        raise
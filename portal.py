@@ -0,0 +1,392 @@
+import re
+import time
+import logging
+import os
+import contextlib
+import urllib.parse
+
+from retries import retry_payload
+from transport import BASE_HOST, BASE_URL, close_stream, stream_request
+
+logger = logging.getLogger(__name__)
+
+class SessionExpiredError(Exception):
+    """Raised when the portal answers with the login page instead of the requested data."""
+
+class LoginFailedError(Exception):
+    """Raised when the portal rejects the login credentials."""
+
+# Common headers
+BASE_HEADERS = {
+    "Host": BASE_HOST,
+    "Cache-Control": "max-age=0",
+    "Sec-Ch-Ua": '"Not)A;Brand";v="8", "Chromium";v="138"',
+    "Sec-Ch-Ua-Mobile": "?0",
+    "Sec-Ch-Ua-Platform": '"Windows"',
+    "Upgrade-Insecure-Requests": "1",
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
+    "Sec-Fetch-Site": "none",
+    "Sec-Fetch-Mode": "navigate",
+    "Sec-Fetch-User": "?1",
+    "Sec-Fetch-Dest": "document",
+    "Accept-Encoding": "gzip, deflate, br",
+    "Accept-Language": "en-GB,en;q=0.9",
+    "Priority": "u=0, i",
+    "Connection": "keep-alive"
+}
+
+# Marker of the login form, which must never appear in an AJAX fragment
+LOGIN_FORM_MARKER = 'name="password"'
+
+def check_session(response, fragment=False):
+    """Raise SessionExpiredError if the portal answered with the login page.
+
+    fragment marks AJAX endpoints that return an HTML fragment, where the
+    login form markup can only mean the session is gone.
+    """
+    if str(response.url).endswith("/login"):
+        raise SessionExpiredError("Session expired: redirected to /login")
+    if fragment and LOGIN_FORM_MARKER in response.text:
+        raise SessionExpiredError("Session expired: login form returned instead of data")
+
+@retry_payload
+async def _open_stream(client, request, conditional=None):
+    """Send request, returning the response once its headers are in and the status is good.
+
+    A 304 answer to the conditional validators is returned as is.
+    """
+    response = await client.send(request, stream=True)
+    if conditional and response.status_code == 304:
+        return response
+    try:
+        response.raise_for_status()
+        check_session(response)
+    except Exception:
+        await response.aclose()
+        raise
+    return response
+
+async def iter_fragment(response):
+    """Yield the body of a streamed AJAX fragment, raising SessionExpiredError on the login form."""
+    marker = LOGIN_FORM_MARKER.encode()
+    overlap = len(marker) - 1
+    # Last bytes received, where a marker split across any number of small chunks may have started
+    tail = b""
+    async for chunk in response.aiter_bytes():
+        if marker in tail + chunk[:overlap] or marker in chunk:
+            raise SessionExpiredError("Session expired: login form returned instead of data")
+        tail = (tail + chunk[-overlap:])[-overlap:]
+        yield chunk
+
+@retry_payload
+async def payload_1(client):
+    """Send GET request to /login to retrieve initial tokens."""
+    url = f"{BASE_URL}/login"
+    headers = BASE_HEADERS.copy()
+    try:
+        response = await client.get(url, headers=headers)
+        response.raise_for_status()
+        token_match = re.search(r'<input type="hidden" name="_token" value="([^"]+)"', response.text)
+        if not token_match:
+            raise ValueError("Could not find _token in response")
+        return {"_token": token_match.group(1)}
+    except Exception as e:
+        logger.error(f"Payload 1 failed: {str(e)}")
+        raise
+
+async def payload_2(client, _token, email=None, password=None):
+    """Send POST request to /login with credentials, IVASMS_EMAIL/IVASMS_PASSWORD by default."""
+    url = f"{BASE_URL}/login"
+    headers = BASE_HEADERS.copy()
+    headers.update({
+        "Content-Type": "application/x-www-form-urlencoded",
+        "Sec-Fetch-Site": "same-origin",
+        "Referer": f"{BASE_URL}/login"
+    })
+    
+    data = {
+        "_token": _token,
+        "email": email or os.getenv("IVASMS_EMAIL"),
+        "password": password or os.getenv("IVASMS_PASSWORD"),
+        "remember": "on",
+        "g-recaptcha-response": "",
+        "submit": "Login"
+    }
+    
+    try:
+        response = await client.post(url, headers=headers, data=data)
+        response.raise_for_status()
+        if str(response.url).endswith("/login"):
+            raise LoginFailedError("Login failed, redirected back to /login")
+        return response
+    except Exception as e:
+        logger.error(f"Payload 2 failed: {str(e)}")
+        raise
+
+@retry_payload
+async def payload_3(client):
+    """Send GET request to /sms/received to get statistics page."""
+    url = f"{BASE_URL}/portal/sms/received"
+    headers = BASE_HEADERS.copy()
+    headers.update({
+        "Sec-Fetch-Site": "same-origin",
+        "Referer": f"{BASE_URL}/portal"
+    })
+    
+    try:
+        response = await client.get(url, headers=headers)
+        response.raise_for_status()
+        check_session(response)
+        token_match = re.search(r'<meta name="csrf-token" content="([^"]+)"', response.text)
+        if not token_match:
+            logger.warning("No CSRF token found in /sms/received response")
+            return response, ""
+        return response, token_match.group(1)
+    except Exception as e:
+        logger.error(f"Payload 3 failed: {str(e)}")
+        raise
+
+def _statistics_request(csrf_token, from_date, to_date, conditional=None):
+    """URL, headers and body of the payload_4 statistics request.
+
+    conditional holds If-None-Match/If-Modified-Since validators, if any.
+    """
+    url = f"{BASE_URL}/portal/sms/received/getsms"
+    headers = BASE_HEADERS.copy()
+    headers.update({
+        "Content-Type": "multipart/form-data; boundary=----WebKitFormBoundaryhkp0qMozYkZV6Ham",
+        "X-Requested-With": "XMLHttpRequest",
+        "Sec-Fetch-Site": "same-origin",
+        "Sec-Fetch-Mode": "cors",
+        "Sec-Fetch-Dest": "empty",
+        "Referer": f"{BASE_URL}/portal/sms/received",
+        "Origin": BASE_URL
+    })
+    headers.update(conditional or {})
+    
+    data = (
+        "------WebKitFormBoundaryhkp0qMozYkZV6Ham\r\n"
+        "Content-Disposition: form-data; name=\"from\"\r\n"
+        "\r\n"
+        f"{from_date}\r\n"
+        f"------WebKitFormBoundaryhkp0qMozYkZV6Ham\r\n"
+        "Content-Disposition: form-data; name=\"to\"\r\n"
+        "\r\n"
+        f"{to_date}\r\n"
+        f"------WebKitFormBoundaryhkp0qMozYkZV6Ham\r\n"
+        "Content-Disposition: form-data; name=\"_token\"\r\n"
+        "\r\n"
+        f"{csrf_token}\r\n"
+        "------WebKitFormBoundaryhkp0qMozYkZV6Ham--\r\n"
+    )
+    return url, headers, data
+
+@retry_payload
+async def payload_4(client, csrf_token, from_date, to_date, conditional=None):
+    """Send POST request to /sms/received/getsms to fetch SMS statistics.
+
+    With conditional validators the response may be a 304 Not Modified.
+    """
+    url, headers, data = _statistics_request(csrf_token, from_date, to_date, conditional)
+    try:
+        response = await client.post(url, headers=headers, content=data)
+        if conditional and response.status_code == 304:
+            return response
+        response.raise_for_status()
+        check_session(response, fragment=True)
+        return response
+    except Exception as e:
+        logger.error(f"Payload 4 failed: {str(e)}")
+        raise
+
+@contextlib.asynccontextmanager
+async def stream_payload_4(client, csrf_token, from_date, to_date, conditional=None):
+    """payload_4 with the body left unread; read it through iter_fragment."""
+    url, headers, data = _statistics_request(csrf_token, from_date, to_date, conditional)
+    try:
+        response = await _open_stream(client, stream_request(client, "POST", url, headers=headers, content=data), conditional)
+    except Exception as e:
+        logger.error(f"Payload 4 failed: {str(e)}")
+        raise
+    try:
+        yield response
+    finally:
+        await close_stream(response)
+
+def _numbers_request(csrf_token, to_date, range_name):
+    """URL, headers and form data of the payload_5 numbers request."""
+    url = f"{BASE_URL}/portal/sms/received/getsms/number"
+    headers = BASE_HEADERS.copy()
+    headers.update({
+        "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
+        "X-Requested-With": "XMLHttpRequest",
+        "Sec-Fetch-Site": "same-origin",
+        "Sec-Fetch-Mode": "cors",
+        "Sec-Fetch-Dest": "empty",
+        "Referer": f"{BASE_URL}/portal/sms/received",
+        "Origin": BASE_URL
+    })
+    
+    data = {
+        "_token": csrf_token,
+        "start": "",
+        "end": to_date,
+        "range": range_name
+    }
+    return url, headers, data
+
+@retry_payload
+async def payload_5(client, csrf_token, to_date, range_name):
+    """Send POST request to /sms/received/getsms/number to get numbers for a range."""
+    url, headers, data = _numbers_request(csrf_token, to_date, range_name)
+    try:
+        response = await client.post(url, headers=headers, data=data)
+        response.raise_for_status()
+        check_session(response, fragment=True)
+        return response
+    except Exception as e:
+        logger.error(f"Payload 5 failed: {str(e)}")
+        raise
+
+@contextlib.asynccontextmanager
+async def stream_payload_5(client, csrf_token, to_date, range_name):
+    """payload_5 with the body left unread; read it through iter_fragment."""
+    url, headers, data = _numbers_request(csrf_token, to_date, range_name)
+    try:
+        response = await _open_stream(client, stream_request(client, "POST", url, headers=headers, data=data))
+    except Exception as e:
+        logger.error(f"Payload 5 failed: {str(e)}")
+        raise
+    try:
+        yield response
+    finally:
+        await close_stream(response)
+
+@retry_payload
+async def payload_6(client, csrf_token, to_date, number, range_name):
+    """Send POST request to /sms/received/getsms/number/sms to get message details."""
+    url = f"{BASE_URL}/portal/sms/received/getsms/number/sms"
+    headers = BASE_HEADERS.copy()
+    headers.update({
+        "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
+        "X-Requested-With": "XMLHttpRequest",
+        "Sec-Fetch-Site": "same-origin",
+        "Sec-Fetch-Mode": "cors",
+        "Sec-Fetch-Dest": "empty",
+        "Referer": f"{BASE_URL}/portal/sms/received",
+        "Origin": BASE_URL
+    })
+    
+    data = {
+        "_token": csrf_token,
+        "start": "",
+        "end": to_date,
+        "Number": number,
+        "Range": range_name
+    }
+    
+    try:
+        response = await client.post(url, headers=headers, data=data)
+        response.raise_for_status()
+        check_session(response, fragment=True)
+        return response
+    except Exception as e:
+        logger.error(f"Payload 6 failed: {str(e)}")
+        raise
+
+@retry_payload
+async def payload_7(client, app):
+    """Send GET request to /portal/sms/test/sms to get available ranges."""
+    url = f"{BASE_URL}/portal/sms/test/sms?app={urllib.parse.quote(app)}&draw=1&columns%5B0%5D%5Bdata%5D=range&columns%5B0%5D%5Borderable%5D=false&columns%5B1%5D%5Bdata%5D=termination.test_number&columns%5B1%5D%5Bsearchable%5D=false&columns%5B1%5D%5Borderable%5D=false&columns%5B2%5D%5Bdata%5D=originator&columns%5B2%5D%5Borderable%5D=false&columns%5B3%5D%5Bdata%5D=messagedata&columns%5B3%5D%5Borderable%5D=false&columns%5B4%5D%5Bdata%5D=senttime&columns%5B4%5D%5Bsearchable%5D=false&order%5B0%5D%5Bcolumn%5D=4&order%5B0%5D%5Bdir%5D=desc&start=0&length=25&search%5Bvalue%5D=&_={int(time.time() * 1000)}"
+    headers = BASE_HEADERS.copy()
+    headers.update({
+        "X-Requested-With": "XMLHttpRequest",
+        "Accept": "application/json, text/javascript, */*; q=0.01",
+        "Sec-Fetch-Site": "same-origin",
+        "Sec-Fetch-Mode": "cors",
+        "Sec-Fetch-Dest": "empty",
+        "Referer": f"{BASE_URL}/portal/sms/test/sms?app={urllib.parse.quote(app)}"
+    })
+    
+    try:
+        response = await client.get(url, headers=headers)
+        response.raise_for_status()
+        check_session(response)
+        return response.json()
+    except Exception as e:
+        logger.error(f"Payload 7 failed for app {app}: {str(e)}")
+        raise
+
+async def payload_8(client, csrf_token, number_ids):
+    """Send POST request to /portal/numbers/return/number/bluck to delete specific numbers."""
+    url = f"{BASE_URL}/portal/numbers/return/number/bluck"
+    headers = BASE_HEADERS.copy()
+    headers.update({
+        "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
+        "X-Csrf-Token": csrf_token,
+        "X-Requested-With": "XMLHttpRequest",
+        "Accept": "*/*",
+        "Sec-Fetch-Site": "same-origin",
+        "Sec-Fetch-Mode": "cors",
+        "Sec-Fetch-Dest": "empty",
+        "Referer": f"{BASE_URL}/portal/numbers",
+        "Origin": BASE_URL
+    })
+    
+    data = {"NumberID[]": number_ids}
+    
+    try:
+        response = await client.post(url, headers=headers, data=data)
+        response.raise_for_status()
+        check_session(response)
+        return response.json()
+    except Exception as e:
+        logger.error(f"Payload 8 failed: {str(e)}")
+        raise
+
+async def payload_9(client, csrf_token):
+    """Send POST request to /portal/numbers/return/allnumber/bluck to delete all numbers."""
+    url = f"{BASE_URL}/portal/numbers/return/allnumber/bluck"
+    headers = BASE_HEADERS.copy()
+    headers.update({
+        "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
+        "X-Csrf-Token": csrf_token,
+        "X-Requested-With": "XMLHttpRequest",
+        "Accept": "*/*",
+        "Sec-Fetch-Site": "same-origin",
+        "Sec-Fetch-Mode": "cors",
+        "Sec-Fetch-Dest": "empty",
+        "Referer": f"{BASE_URL}/portal/numbers",
+        "Origin": BASE_URL
+    })
+    
+    try:
+        response = await client.post(url, headers=headers, data={})
+        response.raise_for_status()
+        check_session(response)
+        return response.json()
+    except Exception as e:
+        logger.error(f"Payload 9 failed: {str(e)}")
+        raise
+
+@retry_payload
+async def payload_active(client):
+    """Send GET request to /portal/live/my_sms to get active SMS data."""
+    url = f"{BASE_URL}/portal/live/my_sms"
+    headers = BASE_HEADERS.copy()
+    headers.update({
+        "Sec-Fetch-Site": "same-origin",
+        "Sec-Fetch-Mode": "navigate",
+        "Sec-Fetch-Dest": "document",
+        "Referer": f"{BASE_URL}/portal"
+    })
+    
+    try:
+        response = await client.get(url, headers=headers)
+        response.raise_for_status()
+        check_session(response)
+        return response
+    except Exception as e:
+        logger.error(f"Payload active failed: {str(e)}")
+        raise
@@ -0,0 +1,115 @@
+import contextlib
+import contextvars
+import logging
+import logging.handlers
+import os
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Opt-in per-cycle stage tracing; slow cycles are written to PROFILE_FILE
+PROFILE_CYCLES = os.getenv("PROFILE_CYCLES", "0").lower() in ("1", "true", "yes", "on")
+PROFILE_SLOW_CYCLE = float(os.getenv("PROFILE_SLOW_CYCLE", "10"))
+PROFILE_FILE = os.getenv("PROFILE_FILE", "cycle_profile.log")
+PROFILE_MAX_BYTES = int(os.getenv("PROFILE_MAX_BYTES", str(1024 * 1024)))
+PROFILE_BACKUPS = int(os.getenv("PROFILE_BACKUPS", "3"))
+
+_current_trace = contextvars.ContextVar("cycle_trace", default=None)
+
+def span(name, **attrs):
+    """Time a stage of the current cycle; a no-op when profiling is off."""
+    trace = _current_trace.get()
+    if trace is None:
+        return contextlib.nullcontext()
+    return trace.span(name, attrs)
+
+class CycleTrace:
+    """Spans recorded during one monitor cycle, as offsets from its start."""
+
+    def __init__(self, number, name=None):
+        self.number = number
+        self.name = name
+        self.started = datetime.now()
+        self.start = time.perf_counter()
+        self.spans = []
+
+    @contextlib.contextmanager
+    def span(self, name, attrs):
+        begin = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self.spans.append((begin - self.start, time.perf_counter() - begin, name, attrs, error))
+
+    @property
+    def label(self):
+        return f"{self.name} cycle {self.number}" if self.name else f"cycle {self.number}"
+
+    def report(self, duration):
+        """Render the trace: every span in start order, then totals per stage."""
+        lines = [
+            f"{self.started.isoformat(timespec='seconds')} {self.label} took {duration:.3f}s "
+            f"({len(self.spans)} spans)"
+        ]
+        for offset, elapsed, name, attrs, error in sorted(self.spans, key=lambda s: s[0]):
+            details = [f"{key}={value}" for key, value in attrs.items()]
+            if error:
+                details.append(f"FAILED {error}")
+            lines.append(" ".join([f"  +{offset:8.3f}s {elapsed:8.3f}s  {name}"] + details))
+
+        totals = {}
+        for _, elapsed, name, _, _ in self.spans:
+            count, total, longest = totals.get(name, (0, 0.0, 0.0))
+            totals[name] = (count + 1, total + elapsed, max(longest, elapsed))
+        lines.append("  stage totals:")
+        for name, (count, total, longest) in sorted(totals.items(), key=lambda item: -item[1][1]):
+            lines.append(f"    {name:<18} {count:>5} calls {total:9.3f}s total {longest:8.3f}s max")
+        return "\n".join(lines)
+
+class CycleProfiler:
+    """Trace each monitor cycle and keep reports of the slow ones in a rotating file."""
+
+    def __init__(self, enabled=PROFILE_CYCLES, slow_threshold=PROFILE_SLOW_CYCLE, path=PROFILE_FILE,
+                 max_bytes=PROFILE_MAX_BYTES, backups=PROFILE_BACKUPS, name=None):
+        self.enabled = enabled
+        self.name = name
+        self.slow_threshold = slow_threshold
+        self.path = path
+        self.cycles = 0
+        self.trace = None
+        self._reports = None
+        if enabled:
+            self._reports = logging.getLogger(f"{__name__}.reports")
+            self._reports.propagate = False
+            self._reports.setLevel(logging.INFO)
+            # Profilers of several accounts share one report file
+            if not self._reports.handlers:
+                handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                self._reports.addHandler(handler)
+                logger.info(f"Cycle profiling on: cycles over {slow_threshold}s are reported to {path}")
+
+    def start_cycle(self):
+        """Begin tracing a cycle, finishing one left open by an early exit."""
+        if not self.enabled:
+            return
+        self.end_cycle()
+        self.cycles += 1
+        self.trace = CycleTrace(self.cycles, self.name)
+        _current_trace.set(self.trace)
+
+    def end_cycle(self):
+        """Finish the current trace and report it if the cycle was slow."""
+        trace, self.trace = self.trace, None
+        if trace is None:
+            return
+        _current_trace.set(None)
+        duration = time.perf_counter() - trace.start
+        if duration >= self.slow_threshold:
+            self._reports.info(trace.report(duration))
+            logger.warning(f"Slow {trace.label} took {duration:.2f}s, breakdown written to {self.path}")
@@ -0,0 +1,122 @@
+import logging
+import os
+import random
+import time
+
+import httpx
+import tenacity
+
+logger = logging.getLogger(__name__)
+
+# Quick retries for connection errors and timeouts
+TRANSIENT_ATTEMPTS = int(os.getenv("RETRY_TRANSIENT_ATTEMPTS", "3"))
+TRANSIENT_MAX_WAIT = float(os.getenv("RETRY_TRANSIENT_MAX_WAIT", "1"))
+# Exponential backoff with jitter for 5xx and 429 responses
+SERVER_ATTEMPTS = int(os.getenv("RETRY_SERVER_ATTEMPTS", "4"))
+SERVER_MAX_WAIT = float(os.getenv("RETRY_SERVER_MAX_WAIT", "10"))
+# Circuit breaker for login failures
+AUTH_FAILURE_THRESHOLD = int(os.getenv("AUTH_FAILURE_THRESHOLD", "3"))
+AUTH_COOLDOWN = float(os.getenv("AUTH_COOLDOWN", "300"))
+AUTH_MAX_COOLDOWN = float(os.getenv("AUTH_MAX_COOLDOWN", "3600"))
+# Backoff of the monitor loop after a failed cycle
+LOOP_BACKOFF_BASE = float(os.getenv("LOOP_BACKOFF_BASE", "1"))
+LOOP_BACKOFF_MAX = float(os.getenv("LOOP_BACKOFF_MAX", "300"))
+
+def is_transient(error):
+    """Connection errors and timeouts, usually gone within a second."""
+    return isinstance(error, httpx.TransportError)
+
+def is_server_error(error):
+    """5xx and 429 responses, which need more time to clear."""
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return status >= 500 or status == 429
+    return False
+
+transient_retry = tenacity.retry(
+    retry=tenacity.retry_if_exception(is_transient),
+    wait=tenacity.wait_exponential_jitter(initial=0.1, max=TRANSIENT_MAX_WAIT),
+    stop=tenacity.stop_after_attempt(TRANSIENT_ATTEMPTS),
+    before_sleep=tenacity.before_sleep_log(logger, logging.WARNING),
+    reraise=True
+)
+
+server_retry = tenacity.retry(
+    retry=tenacity.retry_if_exception(is_server_error),
+    wait=tenacity.wait_random_exponential(multiplier=0.5, max=SERVER_MAX_WAIT),
+    stop=tenacity.stop_after_attempt(SERVER_ATTEMPTS),
+    before_sleep=tenacity.before_sleep_log(logger, logging.WARNING),
+    reraise=True
+)
+
+def retry_payload(func):
+    """Retry a read-only payload on transient errors, then on server errors."""
+    return server_retry(transient_retry(func))
+
+class CircuitOpenError(Exception):
+    """Raised while a circuit breaker refuses calls."""
+
+    def __init__(self, name, retry_in):
+        super().__init__(f"{name} circuit open, retrying in {retry_in:.0f} seconds")
+        self.retry_in = retry_in
+
+class CircuitBreaker:
+    """Refuse calls for a cool-down after threshold consecutive failures.
+
+    After the cool-down one trial call is let through; if it fails the
+    breaker opens again with twice the cool-down, up to max_cooldown.
+    """
+
+    def __init__(self, name, threshold=AUTH_FAILURE_THRESHOLD, cooldown=AUTH_COOLDOWN, max_cooldown=AUTH_MAX_COOLDOWN):
+        self.name = name
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def remaining(self):
+        """Seconds until the breaker lets a trial call through."""
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.cooldown - time.monotonic())
+
+    def check(self):
+        """Raise CircuitOpenError while the breaker is open."""
+        if self.remaining > 0:
+            raise CircuitOpenError(self.name, self.remaining)
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logger.info(f"{self.name} circuit closed")
+        self.failures = 0
+        self.opened_at = None
+        self.cooldown = self.base_cooldown
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures < self.threshold:
+            return
+        if self.opened_at is not None:
+            self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+        self.opened_at = time.monotonic()
+        logger.warning(f"{self.name} circuit opened after {self.failures} failures for {self.cooldown:.0f} seconds")
+
+class Backoff:
+    """Exponential backoff with jitter for consecutive failures."""
+
+    def __init__(self, base=LOOP_BACKOFF_BASE, maximum=LOOP_BACKOFF_MAX):
+        self.base = base
+        self.maximum = maximum
+        self.failures = 0
+
+    def next_delay(self):
+        """Delay before the next attempt, between half and all of base * 2^failures."""
+        delay = min(self.base * 2 ** self.failures, self.maximum)
+        self.failures += 1
+        return random.uniform(delay / 2, delay)
+
+    def reset(self):
+        self.failures = 0
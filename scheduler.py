@@ -0,0 +1,85 @@
+import collections
+import logging
+import os
+import random
+import time
+
+from crawler import changed_ranges
+
+logger = logging.getLogger(__name__)
+
+# Poll interval right after a range changed, and the ceiling reached while quiet
+POLL_MIN_INTERVAL = float(os.getenv("POLL_MIN_INTERVAL", "1"))
+POLL_MAX_INTERVAL = float(os.getenv("POLL_MAX_INTERVAL", "15"))
+# Factor applied to a range's interval after each poll without changes
+POLL_BACKOFF = float(os.getenv("POLL_BACKOFF", "1.5"))
+# Maximum ivasms.com requests per minute of the whole process: every account, login and bot command together
+POLL_REQUEST_BUDGET = int(os.getenv("POLL_REQUEST_BUDGET", "120"))
+# Random extra delay, as a fraction of the interval
+POLL_JITTER = float(os.getenv("POLL_JITTER", "0.1"))
+
+class RequestBudget:
+    """Requests per minute shared by the poll schedulers of every account.
+
+    window is the RequestWindow of the shared connection pool, so requests
+    made outside the monitors (logins, /check, /active) count too.
+    """
+
+    def __init__(self, window, limit=POLL_REQUEST_BUDGET):
+        self.window = window
+        self.limit = limit
+        self.schedulers = 0
+
+class PollScheduler:
+    """Pick the delay before the next statistics poll from recent activity.
+
+    Every range keeps its own interval: it drops to min_interval when the
+    range changes and grows by backoff after each quiet poll, up to
+    max_interval. All ranges arrive with the same statistics response, so
+    the next poll is due at the shortest interval of any range. Polls are
+    further spaced out so that every scheduler sharing the budget together
+    stays within it.
+    """
+
+    def __init__(self, budget, min_interval=POLL_MIN_INTERVAL, max_interval=POLL_MAX_INTERVAL, backoff=POLL_BACKOFF,
+                 jitter=POLL_JITTER):
+        self.budget = budget
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.jitter = jitter
+        self.intervals = {}
+        self._polls = collections.deque()
+        budget.schedulers += 1
+
+    def update(self, previous_ranges_dict, new_ranges, requests=1):
+        """Record one poll: the statistics before and after it and the requests it made."""
+        changed = {r["range_name"] for r in changed_ranges(previous_ranges_dict, new_ranges)}
+        intervals = {}
+        for range_data in new_ranges:
+            range_name = range_data["range_name"]
+            if range_name in changed:
+                intervals[range_name] = self.min_interval
+            else:
+                interval = self.intervals.get(range_name, self.min_interval) * self.backoff
+                intervals[range_name] = min(interval, self.max_interval)
+        self.intervals = intervals
+        self._polls.append((time.monotonic(), requests))
+
+    def next_delay(self):
+        """Seconds to wait before the next statistics poll."""
+        now = time.monotonic()
+        while self._polls and now - self._polls[0][0] >= 60:
+            self._polls.popleft()
+
+        budget = self.budget
+        delay = min(self.intervals.values(), default=self.max_interval)
+        if budget.window.count() >= budget.limit:
+            # Budget used up: wait for the oldest request to leave the window
+            delay = max(delay, budget.window.wait())
+            logger.info(f"Request budget of {budget.limit}/min used up, next poll in {delay:.1f} seconds")
+        elif self._polls:
+            # Spread this scheduler's share of the budget over the minute at the average cost of its recent polls
+            cost = sum(count for _, count in self._polls) / len(self._polls)
+            delay = max(delay, 60 * cost * budget.schedulers / budget.limit)
+        return delay * (1 + random.uniform(0, self.jitter))
@@ -0,0 +1,249 @@
+import asyncio
+import collections
+import json
+import logging
+import os
+import time
+
+from telegram.error import BadRequest, NetworkError, RetryAfter, TelegramError
+
+from metrics import SMS_DELIVERED, TELEGRAM_MESSAGES, TELEGRAM_QUEUE_DEPTH, TELEGRAM_SEND_SECONDS
+from store import write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+# Telegram flood limits: ~30 messages/second per bot, ~20 messages/minute per group
+GLOBAL_RATE = int(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+CHAT_RATE = int(os.getenv("TELEGRAM_CHAT_RATE", "20"))
+MAX_SEND_ATTEMPTS = int(os.getenv("TELEGRAM_MAX_SEND_ATTEMPTS", "5"))
+# Seconds stop() keeps sending on shutdown; messages still queued then are saved to TELEGRAM_OUTBOX_FILE
+SHUTDOWN_TIMEOUT = float(os.getenv("TELEGRAM_SHUTDOWN_TIMEOUT", "20"))
+# Messages left unsent at the last shutdown, sent first on the next start
+OUTBOX_FILE = os.getenv("TELEGRAM_OUTBOX_FILE", "telegram_outbox.json")
+
+# Optional coalescing of several SMS into one Telegram message:
+# "off", "window" (per chat) or "range" (per chat and range)
+COALESCE_MODE = os.getenv("TELEGRAM_COALESCE", "off").lower()
+FLUSH_INTERVAL = float(os.getenv("TELEGRAM_FLUSH_INTERVAL", "3"))
+MAX_MESSAGE_LENGTH = 4096
+COALESCE_SEPARATOR = "\n\n"
+
+class RateLimiter:
+    """Sliding-window limiter allowing max_calls per period seconds."""
+
+    def __init__(self, max_calls, period):
+        self.max_calls = max_calls
+        self.period = period
+        self._calls = collections.deque()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until another call fits in the window, then record it."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                while self._calls and now - self._calls[0] >= self.period:
+                    self._calls.popleft()
+                if len(self._calls) < self.max_calls:
+                    self._calls.append(now)
+                    return
+                await asyncio.sleep(self.period - (now - self._calls[0]))
+
+class TelegramSender:
+    """Long-lived Telegram sender draining one outbound queue per chat.
+
+    Each chat has its own worker task, so messages for the same chat are sent
+    in the order they were queued and a chat held back by its per-chat rate
+    limit never delays the others; all chats share the per-bot limit. With
+    coalescing enabled, messages are buffered per chat (and optionally per
+    range) and packed into one Telegram message of at most 4096 characters,
+    flushed no later than flush_interval seconds after the first one. A
+    packed message Telegram rejects is resent one SMS at a time, so markup
+    broken by one SMS only loses that SMS. The SMS in the queues are already
+    recorded as seen, so whatever stop() cannot send in time is written to
+    outbox_file and sent by start() on the next run.
+    """
+
+    def __init__(self, bot, default_chat_id=None, coalesce=COALESCE_MODE,
+                 flush_interval=FLUSH_INTERVAL, latency=None, outbox_file=OUTBOX_FILE):
+        self.bot = bot
+        self.latency = latency
+        self.default_chat_id = default_chat_id
+        self.coalesce = coalesce
+        self.flush_interval = flush_interval
+        self.outbox_file = outbox_file
+        self._buffers = {}
+        self._flush_timers = {}
+        self._queues = {}
+        self._global_limiter = RateLimiter(GLOBAL_RATE, 1)
+        self._tasks = {}
+        # Item each chat's worker is delivering right now
+        self._sending = {}
+        self._started = False
+        TELEGRAM_QUEUE_DEPTH.set_function(lambda: self.depth)
+
+    def start(self):
+        """Start delivering; every chat gets its worker on its first message."""
+        if not self._started:
+            self._load_outbox()
+            self._started = True
+            for chat_id in self._queues:
+                self._start_worker(chat_id)
+            logger.info("Telegram sender started")
+
+    async def stop(self, timeout=SHUTDOWN_TIMEOUT):
+        """Send the queued messages for up to timeout seconds, then stop the workers.
+
+        Messages not sent by then, including those being sent, are saved to outbox_file.
+        """
+        for key in list(self._buffers):
+            self._flush(key)
+        try:
+            await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self._queues.values())), timeout)
+        except asyncio.TimeoutError:
+            pass
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks = {}
+        self._started = False
+
+        unsent = []
+        for chat_id, queue in self._queues.items():
+            if chat_id in self._sending:
+                unsent.append((chat_id, self._sending.pop(chat_id)))
+                queue.task_done()
+            while not queue.empty():
+                unsent.append((chat_id, queue.get_nowait()))
+                queue.task_done()
+        if unsent:
+            self._save_outbox(unsent)
+
+    def _save_outbox(self, unsent):
+        items = [
+            {"chat_id": chat_id, "texts": texts, "parse_mode": parse_mode, "timings": timings}
+            for chat_id, (texts, parse_mode, timings) in unsent
+        ]
+        try:
+            write_json_atomic(items, self.outbox_file)
+            logger.warning(f"Saved {len(items)} unsent Telegram messages to {self.outbox_file}")
+        except Exception as e:
+            logger.error(f"Failed to save unsent Telegram messages to {self.outbox_file}: {str(e)}")
+
+    def _load_outbox(self):
+        """Queue the messages left unsent by the last run ahead of new ones."""
+        if not self.outbox_file or not os.path.exists(self.outbox_file):
+            return
+        try:
+            with open(self.outbox_file, 'r', encoding='utf-8') as f:
+                items = json.load(f)
+            os.remove(self.outbox_file)
+        except Exception as e:
+            logger.error(f"Failed to load unsent Telegram messages from {self.outbox_file}: {str(e)}")
+            return
+        for item in items:
+            self._queue(item["chat_id"]).put_nowait((item["texts"], item["parse_mode"], item["timings"]))
+        logger.info(f"Sending {len(items)} Telegram messages left unsent by the last run")
+
+    def _queue(self, chat_id):
+        """Outbound queue of a chat, started on first use."""
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            queue = self._queues[chat_id] = asyncio.Queue()
+            if self._started:
+                self._start_worker(chat_id)
+        return queue
+
+    def _start_worker(self, chat_id):
+        if chat_id not in self._tasks:
+            self._tasks[chat_id] = asyncio.create_task(self._worker(chat_id, self._queues[chat_id]))
+
+    def enqueue(self, text, chat_id=None, parse_mode="Markdown", group=None, timing=None):
+        """Queue a message for delivery without waiting for it to be sent.
+
+        group identifies the range the message belongs to for "range" coalescing.
+        timing holds the SMS's latency timestamps, completed on delivery.
+        """
+        chat_id = chat_id or self.default_chat_id
+        if self.coalesce not in ("window", "range"):
+            self._queue(chat_id).put_nowait(([text], parse_mode, [timing]))
+            return
+
+        key = (chat_id, parse_mode, group if self.coalesce == "range" else None)
+        buffer = self._buffers.get(key)
+        if buffer and buffer["length"] + len(COALESCE_SEPARATOR) + len(text) > MAX_MESSAGE_LENGTH:
+            self._flush(key)
+            buffer = None
+        if buffer is None:
+            buffer = self._buffers[key] = {"texts": [], "timings": [], "length": 0}
+            self._flush_timers[key] = asyncio.get_running_loop().call_later(self.flush_interval, self._flush, key)
+        else:
+            buffer["length"] += len(COALESCE_SEPARATOR)
+        buffer["texts"].append(text)
+        buffer["timings"].append(timing)
+        buffer["length"] += len(text)
+
+    def _flush(self, key):
+        """Move a coalescing buffer onto the outbound queue as one message."""
+        timer = self._flush_timers.pop(key, None)
+        if timer:
+            timer.cancel()
+        buffer = self._buffers.pop(key, None)
+        if buffer:
+            chat_id, parse_mode, _ = key
+            self._queue(chat_id).put_nowait((buffer["texts"], parse_mode, buffer["timings"]))
+
+    @property
+    def depth(self):
+        """Number of messages waiting to be sent."""
+        return sum(queue.qsize() for queue in self._queues.values())
+
+    async def _worker(self, chat_id, queue):
+        chat_limiter = RateLimiter(CHAT_RATE, 60)
+        while True:
+            texts, parse_mode, timings = self._sending[chat_id] = await queue.get()
+            try:
+                await self._deliver(chat_id, chat_limiter, texts, parse_mode, timings)
+            except Exception as e:
+                logger.error(f"Sender worker for chat {chat_id} failed: {str(e)}")
+            # Left in place when cancelled, so stop() keeps the message for the next run
+            del self._sending[chat_id]
+            queue.task_done()
+
+    async def _deliver(self, chat_id, chat_limiter, texts, parse_mode, timings):
+        """Send texts as one message; timings[i] belongs to texts[i]."""
+        text = COALESCE_SEPARATOR.join(texts)
+        for attempt in range(1, MAX_SEND_ATTEMPTS + 1):
+            await chat_limiter.acquire()
+            await self._global_limiter.acquire()
+            try:
+                with TELEGRAM_SEND_SECONDS.time():
+                    await self.bot.send_message(chat_id=chat_id, text=text, parse_mode=parse_mode)
+                logger.info(f"Sent to Telegram: {text[:50]}...")
+                TELEGRAM_MESSAGES.labels("sent").inc()
+                SMS_DELIVERED.inc(len(timings))
+                if self.latency:
+                    self.latency.delivered(timings)
+                return
+            except RetryAfter as e:
+                logger.warning(f"Telegram flood control, retrying in {e.retry_after} seconds")
+                await asyncio.sleep(e.retry_after)
+            except BadRequest as e:
+                if len(texts) > 1:
+                    logger.warning(f"Telegram rejected {len(texts)} coalesced SMS, sending them one by one: {str(e)}")
+                    TELEGRAM_MESSAGES.labels("split").inc()
+                    for part, timing in zip(texts, timings):
+                        await self._deliver(chat_id, chat_limiter, [part], parse_mode, [timing])
+                    return
+                logger.error(f"Telegram rejected message: {str(e)}")
+                TELEGRAM_MESSAGES.labels("rejected").inc()
+                return
+            except NetworkError as e:
+                logger.warning(f"Telegram send attempt {attempt} failed: {str(e)}")
+                await asyncio.sleep(min(2 ** attempt, 30))
+            except TelegramError as e:
+                logger.error(f"Failed to send to Telegram: {str(e)}")
+                TELEGRAM_MESSAGES.labels("failed").inc()
+                return
+        logger.error(f"Giving up on Telegram message after {MAX_SEND_ATTEMPTS} attempts: {text[:50]}...")
+        TELEGRAM_MESSAGES.labels("failed").inc()
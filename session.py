@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import os
+import time
+
+import httpx
+
+from metrics import LOGINS
+from portal import LoginFailedError, SessionExpiredError, payload_1, payload_2, payload_3
+from retries import CircuitBreaker
+from transport import create_client, create_transport
+
+logger = logging.getLogger(__name__)
+
+# Re-login proactively after this many seconds
+SESSION_MAX_AGE = int(os.getenv("SESSION_MAX_AGE", "7200"))
+# Minimum seconds between logins to prevent rapid re-authentication loops
+MIN_RELOGIN_INTERVAL = int(os.getenv("MIN_RELOGIN_INTERVAL", "60"))
+
+def is_session_expired(error):
+    """Return True if an exception means the ivasms.com session is no longer valid."""
+    if isinstance(error, SessionExpiredError):
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in (401, 419)
+    return False
+
+def is_auth_failure(error):
+    """Return True if a login attempt was refused rather than interrupted."""
+    if isinstance(error, (LoginFailedError, SessionExpiredError)):
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in (401, 403, 419, 429)
+    return False
+
+class SessionManager:
+    """Own the authenticated ivasms.com session shared by the monitor and bot handlers.
+
+    account supplies the credentials (IVASMS_EMAIL/IVASMS_PASSWORD when None);
+    transport is the connection pool, shared with other sessions when given.
+    The pool outlives re-logins: each login only gets a new client, and with
+    it an empty cookie jar, on the same warm connections.
+    """
+
+    def __init__(self, account=None, transport=None, max_age=SESSION_MAX_AGE, min_relogin_interval=MIN_RELOGIN_INTERVAL):
+        self.account = account
+        self.name = account.name if account else "default"
+        self.transport = transport or create_transport()
+        self.max_age = max_age
+        self.min_relogin_interval = min_relogin_interval
+        self.client = None
+        self.csrf_token = None
+        self.login_time = 0
+        self.login_count = 0
+        self._valid = False
+        self._lock = asyncio.Lock()
+        # Stop hammering the login form after repeated refusals
+        self.breaker = CircuitBreaker(f"Login ({self.name})" if account else "Login")
+
+    @property
+    def expired(self):
+        """Whether the next ensure() call has to log in."""
+        return not self._valid or time.time() - self.login_time > self.max_age
+
+    async def ensure(self):
+        """Return (client, csrf_token) for a logged-in session, logging in if needed."""
+        async with self._lock:
+            if self.expired:
+                self.breaker.check()
+                try:
+                    await self._login()
+                except Exception as e:
+                    LOGINS.labels("failure").inc()
+                    if is_auth_failure(e):
+                        self.breaker.record_failure()
+                    raise
+                LOGINS.labels("success").inc()
+                self.breaker.record_success()
+            return self.client, self.csrf_token
+
+    def invalidate(self, client):
+        """Mark the session expired, unless client belongs to an older session."""
+        if client is self.client and self._valid:
+            logger.info(f"Session invalid for {self.name}. Re-authenticating...")
+            self._valid = False
+
+    async def run(self, operation):
+        """Run operation(client, csrf_token), re-logging in once if the session expired."""
+        client, csrf_token = await self.ensure()
+        try:
+            return await operation(client, csrf_token)
+        except Exception as e:
+            if not is_session_expired(e):
+                raise
+            self.invalidate(client)
+        client, csrf_token = await self.ensure()
+        return await operation(client, csrf_token)
+
+    async def close(self):
+        """Close the underlying HTTP client."""
+        if self.client:
+            await self.client.aclose()
+        self.client = None
+        self._valid = False
+
+    async def _login(self):
+        since_last_login = time.time() - self.login_time
+        if self.login_count and since_last_login < self.min_relogin_interval:
+            wait = self.min_relogin_interval - since_last_login
+            logger.info(f"Waiting {wait:.2f} seconds before re-authenticating")
+            await asyncio.sleep(wait)
+
+        # Drop the old session's cookies; its connections stay in the pool
+        await self.close()
+        client = create_client(self.transport)
+        try:
+            logger.info(f"Executing Payload 1: GET /login ({self.name})")
+            tokens = await payload_1(client)
+
+            logger.info(f"Executing Payload 2: POST /login ({self.name})")
+            if self.account:
+                response = await payload_2(client, tokens["_token"], self.account.email, self.account.password)
+            else:
+                response = await payload_2(client, tokens["_token"])
+            logger.debug(f"Payload 2 response status: {response.status_code}, URL: {response.url}")
+
+            logger.info(f"Executing Payload 3: GET /sms/received ({self.name})")
+            response, csrf_token = await payload_3(client)
+            logger.debug(f"Payload 3 response status: {response.status_code}")
+        except Exception:
+            await client.aclose()
+            raise
+
+        self.client = client
+        self.csrf_token = csrf_token
+        self.login_time = time.time()
+        self.login_count += 1
+        self._valid = True
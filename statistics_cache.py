@@ -0,0 +1,80 @@
+import hashlib
+import logging
+
+from metrics import STATISTICS_CACHE
+
+logger = logging.getLogger(__name__)
+
+def response_digest(response):
+    """Hash of a buffered response body."""
+    return hashlib.blake2b(response.content, digest_size=16).hexdigest()
+
+class StatisticsCache:
+    """Fingerprint of the last payload_4 response whose ranges were fully crawled.
+
+    A later response with the same body hash, or a 304 answer to the ETag and
+    Last-Modified validators it came with, carries the same statistics, so
+    parsing and diffing it can be skipped. The cache only applies while the
+    monitor still holds the snapshot built from that response: a window
+    rollover or a failed range crawl replaces the snapshot and forces a miss.
+    """
+
+    def __init__(self):
+        self.digest = None
+        self.validators = {}
+        self.ranges = None
+        self.snapshot = None
+        self.hits = 0
+        self.misses = 0
+
+    def valid_for(self, snapshot):
+        return self.ranges is not None and snapshot is self.snapshot
+
+    def conditional_headers(self, snapshot):
+        """If-None-Match/If-Modified-Since headers for the next request, when the cache can answer a 304."""
+        if not self.valid_for(snapshot):
+            return {}
+        headers = {}
+        if self.validators.get("etag"):
+            headers["If-None-Match"] = self.validators["etag"]
+        if self.validators.get("last-modified"):
+            headers["If-Modified-Since"] = self.validators["last-modified"]
+        return headers
+
+    def lookup(self, snapshot, response, digest=None):
+        """Cached ranges if response repeats the cached statistics, otherwise None.
+
+        Without a body digest (streamed responses) only a 304 or an ETag can
+        match; a response with neither is not counted as a hit or a miss.
+        """
+        if digest is None and response.status_code != 304 and response.headers.get("etag") is None:
+            return None
+        hit = self.valid_for(snapshot) and (
+            response.status_code == 304
+            or (digest is not None and digest == self.digest)
+            or (self.validators.get("etag") is not None and response.headers.get("etag") == self.validators["etag"])
+        )
+        if not hit:
+            self.misses += 1
+            STATISTICS_CACHE.labels("miss").inc()
+            return None
+        self.hits += 1
+        STATISTICS_CACHE.labels("hit").inc()
+        logger.debug(f"Statistics unchanged, skipping parse ({self.hit_rate:.0%} hit rate)")
+        return self.ranges
+
+    def store(self, response, digest, ranges, snapshot):
+        """Remember a response once every range in it was crawled successfully."""
+        if snapshot != {r["range_name"]: r for r in ranges}:
+            # Some crawl failed and kept older statistics; the next poll must diff again
+            self.ranges = self.snapshot = None
+            return
+        self.digest = digest
+        self.validators = {name: response.headers.get(name) for name in ("etag", "last-modified")}
+        self.ranges = ranges
+        self.snapshot = snapshot
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
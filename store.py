@@ -0,0 +1,469 @@
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+# Storage backend: "sqlite" (default) or "json" (sms_statistics.json + tracker file)
+STORE_BACKEND = os.getenv("STORE_BACKEND", "sqlite").lower()
+# Seconds to batch changes before writing them; 0 writes every cycle that changed something
+STORE_FLUSH_INTERVAL = float(os.getenv("STORE_FLUSH_INTERVAL", "5"))
+# Tracked numbers without new messages for this many seconds are evicted once their range is no longer listed
+TRACKER_IDLE_TTL = float(os.getenv("TRACKER_IDLE_TTL", "172800"))
+# Forwarded messages are kept in the store for this many seconds
+MESSAGE_RETENTION = float(os.getenv("MESSAGE_RETENTION", "604800"))
+# Seconds between eviction sweeps
+PRUNE_INTERVAL = float(os.getenv("PRUNE_INTERVAL", "3600"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ranges (
+    range_name TEXT PRIMARY KEY,
+    range_id TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    paid INTEGER NOT NULL,
+    unpaid INTEGER NOT NULL,
+    revenue REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS numbers (
+    range_name TEXT NOT NULL,
+    number TEXT NOT NULL,
+    number_id TEXT NOT NULL,
+    message_count INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    fingerprints TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (range_name, number)
+);
+CREATE INDEX IF NOT EXISTS numbers_updated ON numbers (updated_at);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    range_name TEXT NOT NULL,
+    number TEXT NOT NULL,
+    message TEXT NOT NULL,
+    revenue TEXT,
+    timestamp TEXT NOT NULL,
+    detected_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_number ON messages (range_name, number, timestamp);
+CREATE INDEX IF NOT EXISTS messages_detected ON messages (detected_at);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+RANGE_FIELDS = ("range_name", "range_id", "count", "paid", "unpaid", "revenue")
+
+def number_entry(number_id, message_count, fingerprints=None, updated_at=None):
+    """Build a tracker entry: message count plus {fingerprint: seen_at} of recent messages.
+
+    Fingerprints stored without a timestamp take updated_at as their seen_at.
+    """
+    if updated_at is None:
+        updated_at = time.time()
+    if not isinstance(fingerprints, dict):
+        fingerprints = {fingerprint: updated_at for fingerprint in fingerprints or ()}
+    return {
+        "number_id": number_id,
+        "message_count": message_count,
+        "fingerprints": fingerprints,
+        "updated_at": updated_at
+    }
+
+def number_values(entry):
+    """Comparable tuple of a tracker entry's persisted fields."""
+    return (entry["number_id"], entry["message_count"], tuple(sorted(entry["fingerprints"].items())), entry["updated_at"])
+
+def encode_fingerprints(fingerprints):
+    return " ".join(f"{fingerprint}:{seen_at:.0f}" for fingerprint, seen_at in fingerprints.items())
+
+def decode_fingerprints(text, updated_at):
+    fingerprints = {}
+    for token in text.split():
+        fingerprint, _, seen_at = token.partition(":")
+        fingerprints[fingerprint] = float(seen_at) if seen_at else updated_at
+    return fingerprints
+
+def write_json_atomic(data, filename):
+    """Write JSON to a temporary file and rename it over filename."""
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".json")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, filename)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+class SqliteBackend:
+    """Indexed SQLite tables for ranges, numbers and forwarded messages, in WAL mode."""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(numbers)")]
+        if columns and "fingerprints" not in columns:
+            self.conn.execute("ALTER TABLE numbers ADD COLUMN fingerprints TEXT NOT NULL DEFAULT ''")
+        self.conn.executescript(SCHEMA)
+
+    @property
+    def empty(self):
+        return not any(
+            self.conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone()
+            for table in ("ranges", "numbers")
+        )
+
+    def load_ranges(self):
+        rows = self.conn.execute(f"SELECT {', '.join(RANGE_FIELDS)} FROM ranges")
+        return [dict(zip(RANGE_FIELDS, row)) for row in rows]
+
+    def load_numbers(self, range_name):
+        rows = self.conn.execute(
+            "SELECT number, number_id, message_count, fingerprints, updated_at FROM numbers WHERE range_name = ?",
+            (range_name,)
+        )
+        return {
+            number: number_entry(number_id, count, decode_fingerprints(fingerprints, updated_at), updated_at)
+            for number, number_id, count, fingerprints, updated_at in rows
+        }
+
+    def write(self, ranges, removed, numbers, dropped, messages):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO ranges VALUES (?, ?, ?, ?, ?, ?)",
+                [tuple(r[field] for field in RANGE_FIELDS) for r in ranges]
+            )
+            self.conn.executemany("DELETE FROM ranges WHERE range_name = ?", [(name,) for name in removed])
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO numbers (range_name, number, number_id, message_count, updated_at, fingerprints) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(r, n, e["number_id"], e["message_count"], e["updated_at"], encode_fingerprints(e["fingerprints"])) for r, n, e in numbers]
+            )
+            self.conn.executemany("DELETE FROM numbers WHERE range_name = ? AND number = ?", dropped)
+            self.conn.executemany(
+                "INSERT INTO messages (range_name, number, message, revenue, timestamp, detected_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(m["range"], m["number"], m["message"], m.get("revenue"), m["timestamp"], m["detected_at"]) for m in messages]
+            )
+
+    def load_meta(self):
+        return dict(self.conn.execute("SELECT key, value FROM meta"))
+
+    def write_meta(self, meta):
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", meta.items())
+
+    def prune(self, idle_before, messages_before, listed=()):
+        with self.conn:
+            numbers = self.conn.execute(
+                "DELETE FROM numbers WHERE updated_at < ? AND range_name NOT IN (SELECT value FROM json_each(?))",
+                (idle_before, json.dumps(list(listed)))
+            ).rowcount
+            messages = self.conn.execute("DELETE FROM messages WHERE detected_at < ?", (messages_before,)).rowcount
+        return numbers, messages
+
+    def close(self):
+        self.conn.close()
+
+class JsonBackend:
+    """The original sms_statistics.json and number tracker files, rewritten atomically."""
+
+    def __init__(self, ranges_file, tracker_file):
+        self.path = f"{ranges_file} and {tracker_file}"
+        self.ranges_file = ranges_file
+        self.tracker_file = tracker_file
+        self.meta_file = f"{os.path.splitext(ranges_file)[0]}_meta.json"
+        self.ranges = {r["range_name"]: r for r in self._load(ranges_file, [])}
+        self.tracker = {
+            range_name: {
+                number: number_entry(
+                    entry["number_id"], entry["message_count"],
+                    entry.get("fingerprints"), entry.get("updated_at")
+                )
+                for number, entry in numbers.items()
+            }
+            for range_name, numbers in self._load(tracker_file, {}).items()
+        }
+
+    def _load(self, filename, default):
+        try:
+            if os.path.exists(filename):
+                with open(filename, 'r', encoding='utf-8') as f:
+                    return json.load(f) or default
+        except Exception as e:
+            logger.error(f"Failed to load from JSON {filename}: {str(e)}")
+        return default
+
+    @property
+    def empty(self):
+        return not (self.ranges or self.tracker)
+
+    def load_ranges(self):
+        return list(self.ranges.values())
+
+    def load_numbers(self, range_name):
+        return {
+            number: dict(entry, fingerprints=dict(entry["fingerprints"]))
+            for number, entry in self.tracker.get(range_name, {}).items()
+        }
+
+    def write(self, ranges, removed, numbers, dropped, messages):
+        if ranges or removed:
+            for range_data in ranges:
+                self.ranges[range_data["range_name"]] = range_data
+            for name in removed:
+                self.ranges.pop(name, None)
+            write_json_atomic(list(self.ranges.values()), self.ranges_file)
+        if numbers or dropped:
+            for range_name, number, entry in numbers:
+                self.tracker.setdefault(range_name, {})[number] = dict(entry)
+            for range_name, number in dropped:
+                self._drop(range_name, number)
+            write_json_atomic(self.tracker, self.tracker_file)
+
+    def load_meta(self):
+        return self._load(self.meta_file, {})
+
+    def write_meta(self, meta):
+        write_json_atomic(dict(self.load_meta(), **meta), self.meta_file)
+
+    def _drop(self, range_name, number):
+        numbers = self.tracker.get(range_name, {})
+        numbers.pop(number, None)
+        if not numbers:
+            self.tracker.pop(range_name, None)
+
+    def prune(self, idle_before, messages_before, listed=()):
+        idle = [
+            (range_name, number)
+            for range_name, numbers in self.tracker.items() if range_name not in listed
+            for number, entry in numbers.items()
+            if entry["updated_at"] < idle_before
+        ]
+        for range_name, number in idle:
+            self._drop(range_name, number)
+        if idle:
+            write_json_atomic(self.tracker, self.tracker_file)
+        return len(idle), 0
+
+    def close(self):
+        pass
+
+class NumberTracker(dict):
+    """number_tracker mapping whose ranges are loaded from the store on first use."""
+
+    def __init__(self, store):
+        super().__init__()
+        self.store = store
+
+    def setdefault(self, range_name, default=None):
+        if range_name not in self:
+            self[range_name] = self.store.load_numbers(range_name)
+        return self[range_name]
+
+    def evict_idle(self, idle_before, listed=()):
+        """Drop numbers without new messages since idle_before and return how many.
+
+        Numbers of listed ranges are kept: the portal may still list them, and
+        a crawl would take a forgotten number's whole history for new SMS.
+        """
+        evicted = 0
+        for range_name in [name for name in self if name not in listed]:
+            numbers = self[range_name]
+            for number in [n for n, entry in numbers.items() if entry["updated_at"] < idle_before]:
+                del numbers[number]
+                evicted += 1
+            if not numbers:
+                del self[range_name]
+        return evicted
+
+class Store:
+    """Dirty-tracking state layer in front of a storage backend.
+
+    save_cycle() compares the cycle's state with what was last seen and
+    queues only the changed ranges, numbers and new messages. Queued changes
+    are written at most once per flush_interval, so quiet cycles do no I/O.
+    Idle numbers of ranges no longer listed and old messages are pruned
+    every PRUNE_INTERVAL seconds.
+    """
+
+    def __init__(self, backend, flush_interval=STORE_FLUSH_INTERVAL, idle_ttl=TRACKER_IDLE_TTL,
+                 message_retention=MESSAGE_RETENTION, prune_interval=PRUNE_INTERVAL):
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self.idle_ttl = idle_ttl
+        self.message_retention = message_retention
+        self.prune_interval = prune_interval
+        self.last_prune = time.time()
+        self._ranges = {}
+        self._numbers = {}
+        self._pending_ranges = {}
+        self._pending_removed = set()
+        self._pending_numbers = {}
+        self._pending_dropped = set()
+        self._pending_messages = []
+        self._dirty_since = None
+
+    @property
+    def empty(self):
+        """Whether nothing has been stored yet."""
+        return self.backend.empty
+
+    @property
+    def dirty(self):
+        """Whether there are changes waiting to be written."""
+        return self._dirty_since is not None
+
+    def load_ranges(self):
+        """Return the stored statistics snapshot as {range_name: range}."""
+        ranges = {r["range_name"]: r for r in self.backend.load_ranges()}
+        self._ranges = {name: tuple(r[field] for field in RANGE_FIELDS) for name, r in ranges.items()}
+        return ranges
+
+    def load_numbers(self, range_name):
+        """Return the tracked numbers of one range as {number: entry}."""
+        numbers = self.backend.load_numbers(range_name)
+        self._numbers[range_name] = {number: number_values(entry) for number, entry in numbers.items()}
+        return numbers
+
+    def tracker(self):
+        """Return a number tracker backed by this store."""
+        return NumberTracker(self)
+
+    def get_meta(self, key, default=None):
+        """Return a stored setting, such as the date window of the stored statistics."""
+        return self.backend.load_meta().get(key, default)
+
+    def set_meta(self, key, value):
+        """Store a setting immediately."""
+        try:
+            self.backend.write_meta({key: value})
+        except Exception as e:
+            logger.error(f"Failed to save {key} to {self.backend.path}: {str(e)}")
+
+    def save_cycle(self, ranges_dict, number_tracker, new_sms=(), force=False):
+        """Queue the changes made by one monitor cycle and flush them when due."""
+        for range_name, range_data in ranges_dict.items():
+            values = tuple(range_data[field] for field in RANGE_FIELDS)
+            if self._ranges.get(range_name) != values:
+                self._ranges[range_name] = values
+                self._pending_ranges[range_name] = dict(zip(RANGE_FIELDS, values))
+                self._pending_removed.discard(range_name)
+                self._mark_dirty()
+        for range_name in [name for name in self._ranges if name not in ranges_dict]:
+            del self._ranges[range_name]
+            self._pending_ranges.pop(range_name, None)
+            self._pending_removed.add(range_name)
+            self._mark_dirty()
+
+        for range_name, range_tracker in number_tracker.items():
+            seen = self._numbers.setdefault(range_name, {})
+            for number, entry in range_tracker.items():
+                values = number_values(entry)
+                if seen.get(number) != values:
+                    seen[number] = values
+                    self._pending_numbers[(range_name, number)] = dict(entry, fingerprints=dict(entry["fingerprints"]))
+                    self._pending_dropped.discard((range_name, number))
+                    self._mark_dirty()
+            # Numbers the crawler dropped because they were returned
+            for number in [n for n in seen if n not in range_tracker]:
+                del seen[number]
+                self._pending_numbers.pop((range_name, number), None)
+                self._pending_dropped.add((range_name, number))
+                self._mark_dirty()
+
+        if new_sms:
+            now = time.time()
+            self._pending_messages.extend(dict(sms, detected_at=sms.get("detected_at", now)) for sms in new_sms)
+            self._mark_dirty()
+
+        if self.dirty and (force or time.time() - self._dirty_since >= self.flush_interval):
+            self.flush()
+        if time.time() - self.last_prune >= self.prune_interval:
+            self.prune(number_tracker, ranges_dict)
+
+    def _mark_dirty(self):
+        if self._dirty_since is None:
+            self._dirty_since = time.time()
+
+    def flush(self):
+        """Write all queued changes to the backend."""
+        if not self.dirty:
+            return
+        ranges = list(self._pending_ranges.values())
+        removed = list(self._pending_removed)
+        numbers = [key + (entry,) for key, entry in self._pending_numbers.items()]
+        dropped = list(self._pending_dropped)
+        messages = self._pending_messages
+        try:
+            self.backend.write(ranges, removed, numbers, dropped, messages)
+        except Exception as e:
+            # Keep the queued changes so the next flush retries them
+            logger.error(f"Failed to save state to {self.backend.path}: {str(e)}")
+            return
+
+        self._pending_ranges = {}
+        self._pending_removed = set()
+        self._pending_numbers = {}
+        self._pending_dropped = set()
+        self._pending_messages = []
+        self._dirty_since = None
+        logger.info(
+            f"Saved {len(ranges) + len(removed)} ranges, {len(numbers) + len(dropped)} numbers "
+            f"and {len(messages)} messages to {self.backend.path}"
+        )
+
+    def prune(self, number_tracker, listed=()):
+        """Evict idle numbers from memory and the backend, and expire old messages.
+
+        listed holds the ranges of the current statistics, whose numbers are kept.
+        """
+        self.flush()
+        now = time.time()
+        self.last_prune = now
+        idle_before = now - self.idle_ttl
+        evicted = number_tracker.evict_idle(idle_before, listed) if isinstance(number_tracker, NumberTracker) else 0
+        for range_name in [name for name in self._numbers if name not in listed]:
+            seen = self._numbers[range_name]
+            for number in [n for n, values in seen.items() if values[3] < idle_before]:
+                del seen[number]
+            if not seen:
+                del self._numbers[range_name]
+        try:
+            numbers, messages = self.backend.prune(idle_before, now - self.message_retention, listed)
+        except Exception as e:
+            logger.error(f"Failed to prune {self.backend.path}: {str(e)}")
+            return
+        logger.info(f"Pruned {numbers} idle numbers ({evicted} in memory) and {messages} old messages")
+
+    def import_json(self, ranges_file, tracker_file):
+        """Import the legacy sms_statistics.json and number tracker JSON files, if present."""
+        legacy = JsonBackend(ranges_file, tracker_file)
+        if legacy.empty:
+            return
+        tracker = {range_name: legacy.load_numbers(range_name) for range_name in legacy.tracker}
+        self.save_cycle({r["range_name"]: r for r in legacy.load_ranges()}, tracker, force=True)
+        logger.info(f"Imported {legacy.path} into {self.backend.path}")
+
+    def close(self):
+        """Write queued changes and close the backend."""
+        try:
+            self.flush()
+        finally:
+            self.backend.close()
+
+def open_store(db_file, ranges_file, tracker_file, backend=STORE_BACKEND):
+    """Open the configured store, importing the legacy JSON files into a new database."""
+    if backend == "json":
+        return Store(JsonBackend(ranges_file, tracker_file))
+    store = Store(SqliteBackend(db_file))
+    if store.empty:
+        store.import_json(ranges_file, tracker_file)
+    return store
@@ -0,0 +1,136 @@
+import json
+import random
+from datetime import datetime, timedelta
+from html import escape
+
+# Markup mirrors the responses saved under fixtures/
+
+def render_statistics(ranges):
+    """Render a /portal/sms/received/getsms response for a list of range dicts."""
+    if not ranges:
+        return (
+            '<div class="row"><div class="col-12">'
+            '<p id="messageFlash" class="text-center text-muted">You do not have any SMS in the selected date range.</p>'
+            '</div></div>'
+        )
+    cards = []
+    for r in ranges:
+        name = escape(r["range_name"])
+        cards.append(
+            f'<div class="card card-body mb-1 pointer" onclick="getDetials(\'{name}\')">\n'
+            '    <div class="row align-items-center">\n'
+            f'        <div class="col-sm-4 col-12 text-center text-sm-start"><h6 class="mb-0">{name}</h6></div>\n'
+            f'        <div class="col-3 col-sm-2 text-center text-sm-start"><p class="mb-0 pb-0">{r["count"]}</p></div>\n'
+            f'        <div class="col-3 col-sm-2 text-center text-sm-start"><p class="mb-0 pb-0">{r["paid"]}</p></div>\n'
+            f'        <div class="col-3 col-sm-2 text-center text-sm-start"><p class="mb-0 pb-0">{r["unpaid"]}</p></div>\n'
+            f'        <div class="col-3 col-sm-2 text-center text-sm-start"><p class="mb-0 pb-0"><span class="currency_cdr">{r["revenue"]}</span> USD</p></div>\n'
+            '    </div>\n'
+            '</div>'
+        )
+    return '<div class="row"><div class="col-12">\n' + "\n".join(cards) + '\n</div></div>'
+
+def render_numbers(numbers):
+    """Render a /getsms/number response for a list of number dicts."""
+    rows = []
+    for n in numbers:
+        rows.append(
+            '<div class="card card-body border-bottom bg-100 p-2 rounded-0">\n'
+            '    <div class="row align-items-center">\n'
+            f'        <div class="col-sm-4 col-12 text-center text-sm-start pointer" onclick="getDetialsNumber(\'{n["number"]}\',\'{n["number_id"]}\')">{n["number"]}</div>\n'
+            f'        <div class="col-3 col-sm-2 text-center text-sm-start"><p class="mb-0">{n.get("count", 1)}</p></div>\n'
+            '    </div>\n'
+            '</div>'
+        )
+    return "\n".join(rows)
+
+def render_messages(messages):
+    """Render a /getsms/number/sms response for messages listed newest first."""
+    rows = []
+    for m in messages:
+        rows.append(
+            '<tr><td><div class="row">\n'
+            f'    <div class="col-9 col-sm-6 text-center text-sm-start"><p class="mb-0">{escape(m["message"])}</p></div>\n'
+            f'    <div class="col-3 col-sm-2 text-center text-sm-start"><p class="mb-0"><span class="currency_cdr">{m["revenue"]}</span></p></div>\n'
+            f'    <div class="col-12 col-sm-4 text-center text-sm-start"><p class="mb-0">{m["timestamp"]}</p></div>\n'
+            '</div></td></tr>'
+        )
+    return '<table class="table table-sm mb-0"><tbody>\n' + "\n".join(rows) + '\n</tbody></table>'
+
+def render_active(range_names, total_numbers):
+    """Render a /portal/live/my_sms page."""
+    cards = "\n".join(
+        '<div class="card card-secondary"><div class="card-header"><h4 class="card-title w-100">'
+        f'<a class="d-block w-100" data-toggle="collapse" href="#c{i}">{escape(name)}</a></h4></div>'
+        f'<div id="c{i}" class="collapse"><div class="card-body">...</div></div></div>'
+        for i, name in enumerate(range_names)
+    )
+    return (
+        '<!DOCTYPE html><html lang="en"><head><meta charset="utf-8"><title>My SMS | IVA SMS</title></head><body>'
+        '<div class="container-fluid"><div class="card">'
+        f'<div class="card-header"><h6 class="mb-0">My Numbers ({total_numbers})</h6></div>'
+        f'<div class="card-body"><div id="accordion">\n{cards}\n</div></div>'
+        '</div></div></body></html>'
+    )
+
+def render_ranges_json(test_sms):
+    """Render a /portal/sms/test/sms DataTables response."""
+    return json.dumps({
+        "draw": 1,
+        "recordsTotal": len(test_sms),
+        "recordsFiltered": len(test_sms),
+        "data": test_sms
+    })
+
+def make_message(rng, when, ref=None):
+    """Build one synthetic OTP message, optionally tagged with a reference number."""
+    app = rng.choice(["WhatsApp", "Telegram", "Facebook", "Google"])
+    code = rng.randint(100000, 999999)
+    tag = f" ref {ref}" if ref is not None else ""
+    return {
+        "message": f"Your {app} code: {code // 1000}-{code % 1000:03d}. Don't share this code with others{tag}",
+        "revenue": f"{rng.choice([0.01, 0.02, 0.03]):.2f}",
+        "timestamp": when.strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+def make_account(range_count, numbers_per_range, messages_per_number=1, seed=0):
+    """Build a synthetic account: {range_name: {number: {"number_id", "messages"}}}.
+
+    Messages are stored newest first, the order the portal lists them in.
+    """
+    rng = random.Random(seed)
+    start = datetime(2026, 1, 1, 8, 0, 0)
+    account = {}
+    next_id = 1
+    for r in range(range_count):
+        range_name = f"RANGE {r:04d} {rng.randint(1000, 9999)}"
+        numbers = {}
+        for n in range(numbers_per_range):
+            number = f"22507{r:04d}{n:04d}"
+            messages = [make_message(rng, start + timedelta(seconds=next_id * 7 + i)) for i in range(messages_per_number)]
+            numbers[number] = {"number_id": str(next_id), "messages": messages[::-1]}
+            next_id += 1
+        account[range_name] = numbers
+    return account
+
+def account_statistics(account):
+    """Range dicts for an account, as parse_statistics would return them."""
+    ranges = []
+    for range_name, numbers in account.items():
+        count = sum(len(n["messages"]) for n in numbers.values())
+        revenue = round(sum(float(m["revenue"]) for n in numbers.values() for m in n["messages"]), 2)
+        ranges.append({
+            "range_name": range_name,
+            "range_id": range_name,
+            "count": count,
+            "paid": count,
+            "unpaid": 0,
+            "revenue": revenue
+        })
+    return ranges
+
+def account_numbers(account, range_name):
+    """Number dicts for one range of an account."""
+    return [
+        {"number": number, "number_id": data["number_id"], "count": len(data["messages"])}
+        for number, data in account.get(range_name, {}).items()
+    ]
@@ -0,0 +1,179 @@
+import asyncio
+import collections
+import contextlib
+import logging
+import os
+import time
+
+import urllib.parse
+
+import httpx
+
+from metrics import CONNECTIONS_OPENED, REQUEST_SECONDS, RESPONSE_BYTES
+
+try:
+    import h2
+except ImportError:
+    h2 = None
+
+logger = logging.getLogger(__name__)
+
+# Portal location; point it at mock_server.py for offline load tests
+BASE_URL = os.getenv("IVASMS_BASE_URL", "https://www.ivasms.com").rstrip("/")
+BASE_HOST = urllib.parse.urlsplit(BASE_URL).netloc
+
+# Connection pool and timeout settings for the shared ivasms.com client
+MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE", "10"))
+KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+REQUEST_TIMEOUT = float(os.getenv("HTTP_REQUEST_TIMEOUT", "30"))
+# Multiplex requests over HTTP/2 when the portal offers it; needs the h2 package (httpx[http2])
+HTTP2 = os.getenv("HTTP_HTTP2", "0").lower() in ("1", "true", "yes", "on")
+if HTTP2 and h2 is None:
+    logger.warning("h2 is not installed, falling back to HTTP/1.1")
+    HTTP2 = False
+
+# Request extension marking responses whose body the caller reads incrementally
+STREAM_EXTENSION = "ivasms_stream"
+
+def _observe(response):
+    endpoint = response.request.url.path
+    REQUEST_SECONDS.labels(response.request.method, endpoint, response.status_code).observe(response.elapsed.total_seconds())
+    RESPONSE_BYTES.labels(endpoint).inc(response.num_bytes_downloaded)
+
+async def _trace(event_name, info):
+    if event_name == "connection.connect_tcp.complete":
+        CONNECTIONS_OPENED.inc()
+
+async def trace_request(request):
+    """Request hook counting the new connections a request had to open."""
+    request.extensions["trace"] = _trace
+
+async def record_response(response):
+    """Response hook recording latency and downloaded bytes per endpoint."""
+    if response.request.extensions.get(STREAM_EXTENSION):
+        # Recorded by close_stream once the caller has consumed the body
+        return
+    await response.aread()
+    _observe(response)
+
+def stream_request(client, method, url, **kwargs):
+    """Build a request whose response body is left unread by record_response."""
+    request = client.build_request(method, url, **kwargs)
+    request.extensions[STREAM_EXTENSION] = True
+    return request
+
+async def close_stream(response):
+    """Close a streamed response and record it like record_response does."""
+    await response.aclose()
+    _observe(response)
+
+def _limits():
+    return httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY
+    )
+
+class RequestWindow:
+    """Send times of the requests of the last period seconds."""
+
+    def __init__(self, period=60):
+        self.period = period
+        self._sent = collections.deque()
+
+    def record(self):
+        self._sent.append(time.monotonic())
+
+    def count(self):
+        """Number of requests sent within the window."""
+        now = time.monotonic()
+        while self._sent and now - self._sent[0] >= self.period:
+            self._sent.popleft()
+        return len(self._sent)
+
+    def wait(self):
+        """Seconds until the oldest request leaves the window."""
+        return self.period - (time.monotonic() - self._sent[0]) if self.count() else 0.0
+
+class SharedTransport(httpx.AsyncHTTPTransport):
+    """Connection pool shared by the clients of several sessions.
+
+    Closing a client leaves the pool open, so a re-login only starts a new
+    cookie jar and keeps the warm connections; call close_pool() on shutdown.
+    window records every request sent through the pool, whichever session
+    or command sent it.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.window = RequestWindow()
+
+    async def handle_async_request(self, request):
+        self.window.record()
+        return await super().handle_async_request(request)
+
+    async def aclose(self):
+        pass
+
+    async def close_pool(self):
+        await super().aclose()
+
+def create_transport():
+    """Create a connection pool that several clients (one per account) can share."""
+    logger.debug(f"Creating shared connection pool (max_connections={MAX_CONNECTIONS}, keepalive={MAX_KEEPALIVE_CONNECTIONS}, "
+                 f"http2={HTTP2})")
+    return SharedTransport(limits=_limits(), http2=HTTP2)
+
+def create_client(transport=None):
+    """Create the async HTTP client shared by every payload_* call of a session.
+
+    With a shared transport the client only holds the session's cookies and
+    borrows connections from the shared pool, which has its own limits.
+    """
+    if transport is None:
+        logger.debug(f"Creating HTTP client (max_connections={MAX_CONNECTIONS}, keepalive={MAX_KEEPALIVE_CONNECTIONS})")
+        pool = {"limits": _limits(), "http2": HTTP2}
+    else:
+        pool = {"transport": transport}
+    return httpx.AsyncClient(
+        **pool,
+        timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT),
+        follow_redirects=True,
+        event_hooks={"request": [trace_request], "response": [record_response]}
+    )
+
+# Bounded fan-out for the range -> numbers -> messages walk of every account together.
+# Kept below HTTP_MAX_CONNECTIONS so statistics polls and bot commands still find a free connection.
+MAX_IN_FLIGHT = int(os.getenv("HTTP_MAX_IN_FLIGHT", "16"))
+if MAX_IN_FLIGHT > MAX_CONNECTIONS:
+    logger.warning(f"HTTP_MAX_IN_FLIGHT={MAX_IN_FLIGHT} exceeds HTTP_MAX_CONNECTIONS={MAX_CONNECTIONS}, "
+                   f"the excess requests wait for a pooled connection")
+
+class RequestLimiter:
+    """Cap concurrent portal requests of all sessions sharing a connection pool."""
+
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT):
+        self.requests = 0
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        """Hold one slot for the duration of a request."""
+        async with self._semaphore:
+            self.requests += 1
+            yield
+
+class RequestCounter:
+    """One account's share of a RequestLimiter, counting that account's requests."""
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self.requests = 0
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        async with self.limiter.slot():
+            self.requests += 1
+            yield
@@ -0,0 +1,48 @@
+import logging
+import os
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+logger = logging.getLogger(__name__)
+
+# Timezone whose calendar day the statistics window follows (empty = server local time)
+WINDOW_TIMEZONE = os.getenv("WINDOW_TIMEZONE", "")
+# Hour of the day, in WINDOW_TIMEZONE, at which a new window starts
+WINDOW_ROLLOVER_HOUR = int(os.getenv("WINDOW_ROLLOVER_HOUR", "0"))
+
+DATE_FORMAT = "%m/%d/%Y"
+
+class DateWindow:
+    """The from_date/to_date pair sent with payload_4, rolled over once a day."""
+
+    def __init__(self, timezone=WINDOW_TIMEZONE, rollover_hour=WINDOW_ROLLOVER_HOUR):
+        self.timezone = ZoneInfo(timezone) if timezone else None
+        self.rollover_hour = rollover_hour
+        self.day = self.current_day()
+
+    def current_day(self, now=None):
+        """The date whose window is active at now."""
+        now = now or datetime.now(self.timezone)
+        return (now - timedelta(hours=self.rollover_hour)).date()
+
+    def refresh(self, now=None):
+        """Move to the current day's window and return True if it changed."""
+        day = self.current_day(now)
+        if day == self.day:
+            return False
+        logger.info(f"Date window rolled over from {self.day.isoformat()} to {day.isoformat()}")
+        self.day = day
+        return True
+
+    @property
+    def key(self):
+        """ISO date identifying the window, stored alongside its statistics."""
+        return self.day.isoformat()
+
+    @property
+    def from_date(self):
+        return self.day.strftime(DATE_FORMAT)
+
+    @property
+    def to_date(self):
+        return (self.day + timedelta(days=1)).strftime(DATE_FORMAT)